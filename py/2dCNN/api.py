@@ -5,23 +5,69 @@ Comprehensive Flask API for AI Art vs Real Art classification
 
 import os
 import torch
+import numpy as np
 import tempfile
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from werkzeug.utils import secure_filename
-from PIL import Image
 import traceback
+from types import SimpleNamespace
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:  # keep Flask's stdlib encoder
+    orjson = None
+
 from api_utils import (
     download_image_from_url, extract_video_frames, download_video_from_url,
     get_image_transforms, predict_single_image, predict_multiple_images,
-    save_prediction_result, format_api_response, validate_file_upload,
-    cleanup_temp_files, is_valid_url, TinyCNN, NanoCNN
+    save_prediction_result_async, format_api_response, validate_file_upload,
+    cleanup_temp_files, is_valid_url, fuse_conv_bn, quantize_for_cpu, compile_for_inference,
+    export_to_onnx_runtime, load_checkpoint, CHECKPOINT_EXTENSIONS,
+    format_prediction, format_predictions, BatchScheduler, SchedulerOverloaded, StagingBuffer, PredictionCache, URLValidators, content_digest,
+    decode_upload, PREPROCESS_POOL, DOWNLOAD_POOL, INPUT_SIZES, IN_MEMORY_VIDEO_DECODE,
+    TinyCNN, TinySeparableCNN, NanoCNN
 )
 
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson; also serializes NumPy arrays/scalars natively"""
+
+    def _option(self, indent=False):
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default,
+                            option=self._option(bool(kwargs.get('indent')))).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response instead of round-tripping through str
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default,
+                            option=self._option(indent) | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
 app = Flask(__name__)
+if orjson is not None:
+    app.json = ORJSONProvider(app)
 # Max upload size: 100MB (align with error handler below)
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024
+# Non-file form fields are buffered in memory: cap them at 1MB and bound the number of
+# multipart parts; file parts are spooled to a temp file instead of held in RAM
+# (both keys are read by Flask 3.1+, see requirements.txt)
+app.config['MAX_FORM_MEMORY_SIZE'] = 1024 * 1024
+app.config['MAX_FORM_PARTS'] = 256
 
 # GPU optimization configuration
 # Device detection: MPS (Apple Silicon) > CUDA (NVIDIA) > CPU
@@ -32,18 +78,76 @@ elif torch.cuda.is_available():
     device = torch.device("cuda")
     torch.backends.cudnn.benchmark = True  # Enable cuDNN auto-tuner for better performance
     torch.backends.cudnn.enabled = True
+    # Let FP32 convs/matmuls that stay in FP32 (e.g. outside autocast) use TF32 Tensor Cores on Ampere+
+    torch.backends.cudnn.allow_tf32 = True
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.set_float32_matmul_precision('high')
     print(f"GPU detected: {torch.cuda.get_device_name(0)}")
     print(f"CUDA version: {torch.version.cuda}")
 else:
     device = torch.device("cpu")
     print("Warning: No GPU detected, running on CPU")
 
+# FP16 weights only pay off on GPUs with Tensor Cores (Volta+); on older cards FP16 is
+# slower than FP32, and MPS fp16 support is uneven, so those keep FP32 weights
+USE_FP16 = device.type == 'cuda' and torch.cuda.get_device_capability(0)[0] >= 7
+
+# Set TORCH_COMPILE=0 to serve eager models (e.g. when debugging)
+TORCH_COMPILE = os.environ.get('TORCH_COMPILE', '1') != '0'
+# Also run torch.jit.optimize_for_inference on TorchScript models; it helps large
+# batches on CPU but slows batch=1, so it is opt-in (JIT_OPTIMIZE=1)
+JIT_OPTIMIZE = os.environ.get('JIT_OPTIMIZE', '0') == '1'
+# INT8 quantization when serving on CPU (static if a calib/ image folder sits next to
+# the checkpoints, else dynamic on Linear layers); set QUANTIZE_CPU=0 to keep FP32
+QUANTIZE_CPU = os.environ.get('QUANTIZE_CPU', '1') != '0'
+# Serve through ONNX Runtime when it is installed (set ONNX_RUNTIME=0 to stay on PyTorch)
+ONNX_RUNTIME = os.environ.get('ONNX_RUNTIME', '1') != '0'
+
 models = {}
 transforms_dict = {}
 model_info = {}
+# Persistent host/device input buffers per model, shared by a model's aliases
+staging_buffers = {}
+# Per-name snapshot of everything a handler needs (built once by load_models)
+resolved_models = {}
+default_model_name = None
+
+# Concurrent /predict/image and /predict/batch requests share forward passes
+# (tune with MAX_BATCH_SIZE / BATCH_TIMEOUT_MS)
+batch_scheduler = BatchScheduler(device)
+# Seconds clients are told to wait before retrying when the batch queue is full
+OVERLOAD_RETRY_AFTER = os.environ.get('OVERLOAD_RETRY_AFTER', '1')
+# Seconds a request waits for its batched prediction
+PREDICT_TIMEOUT = 60
+
+# Recent predictions keyed by (model file, image URL or content digest); send nocache=1 to bypass
+prediction_cache = PredictionCache(
+    maxsize=int(os.environ.get('PREDICTION_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('PREDICTION_CACHE_TTL', '3600'))
+)
+
+
+# ETag / Last-Modified per image URL; cached URL predictions older than this many seconds
+# are revalidated with a conditional GET before being reused
+url_validators = URLValidators(max_age=float(os.environ.get('URL_REVALIDATE_AFTER', '300')))
+
+
+def _cache_lookup_enabled():
+    return request.values.get('nocache') != '1'
+
+def overloaded_response(e):
+    """503 for requests shed because the model's batch queue is full"""
+    response = jsonify(format_api_response(
+        success=False,
+        error=str(e),
+        message="Server is overloaded, please retry shortly"
+    ))
+    response.status_code = 503
+    response.headers['Retry-After'] = OVERLOAD_RETRY_AFTER
+    return response
 
 def load_models():
-    global models, transforms_dict, model_info
+    global models, transforms_dict, model_info, staging_buffers, resolved_models, default_model_name
 
     # Determine candidate model directories (env override first)
     here = os.path.dirname(os.path.abspath(__file__))
@@ -53,21 +157,27 @@ def load_models():
         candidates.append(env_dir)
     candidates.extend([
         os.path.join(here, 'models'),
-        here,  # allow placing *.pth directly under py/2dCNN/
+        here,  # allow placing *.pth / *.safetensors directly under py/2dCNN/
     ])
 
-    # Gather model files from all existing candidate directories
+    # Gather model files from all existing candidate directories; when a model exists as
+    # both .safetensors and .pth, only the preferred format is loaded
     searched = []
     model_paths = []
     for d in candidates:
         if d and os.path.isdir(d):
             searched.append(d)
-            for f in os.listdir(d):
-                if f.endswith('.pth'):
+            listing = os.listdir(d)
+            files = set(listing)
+            for f in listing:
+                stem, ext = os.path.splitext(f)
+                if ext in CHECKPOINT_EXTENSIONS and not any(
+                        stem + preferred in files
+                        for preferred in CHECKPOINT_EXTENSIONS[:CHECKPOINT_EXTENSIONS.index(ext)]):
                     model_paths.append(os.path.join(d, f))
 
     if not model_paths:
-        print("Warning: No model files (.pth) found. You can set MODEL_DIR or place models under:")
+        print(f"Warning: No model files ({', '.join(CHECKPOINT_EXTENSIONS)}) found. You can set MODEL_DIR or place models under:")
         for d in candidates:
             print(f" - {d}")
         return
@@ -77,38 +187,74 @@ def load_models():
     for model_path in model_paths:
         model_file = os.path.basename(model_path)
         try:
-            if 'tiny' in model_file.lower():
-                model = TinyCNN(num_classes=2).to(device)
+            if 'separable' in model_file.lower():
+                model_cls = TinySeparableCNN
+                transform_key = 'tiny'
+                model_type = 'TinySeparableCNN'
+            elif 'tiny' in model_file.lower():
+                model_cls = TinyCNN
                 transform_key = 'tiny'
                 model_type = 'TinyCNN'
             elif 'nano' in model_file.lower():
-                model = NanoCNN(num_classes=2).to(device)
+                model_cls = NanoCNN
                 transform_key = 'nano'
                 model_type = 'NanoCNN'
             else:
                 # Skip unknown model types for now
                 # Add ResNet50 and ViT loading here
                 continue            
-            state = torch.load(model_path, map_location=device)
-            # Allow older/newer checkpoints with partial key mismatch
-            missing, unexpected = model.load_state_dict(state, strict=False)
+            # Build the parameters directly on the target device instead of on CPU + copy
+            with torch.device(device):
+                model = model_cls(num_classes=2)
+            state = load_checkpoint(model_path, device)
+            # Allow older/newer checkpoints with partial key mismatch. When the checkpoint
+            # tensors already live on the device they become the parameters (no copy).
+            on_device = all(t.device.type == device.type for t in state.values())
+            missing, unexpected = model.load_state_dict(state, strict=False, assign=on_device)
+            del state
             if missing or unexpected:
                 print(f"Warning: state_dict mismatch for {model_file}. Missing: {len(missing)}, Unexpected: {len(unexpected)}")
             model.eval()
-            # Use half precision for faster inference on GPU
-            if torch.cuda.is_available():
+            # Report the trained architecture's size, not the fused/compiled one
+            num_parameters = sum(p.numel() for p in model.parameters())
+            # Fold BatchNorm into the preceding convs before any precision change or compilation
+            model = fuse_conv_bn(model)
+            # Use half precision for faster inference on Tensor Core GPUs
+            if USE_FP16:
                 model = model.half()
-            model_name = model_file.replace('.pth', '')
+            if device.type == 'cuda':
+                # NHWC layout lets cuDNN use its Tensor Core conv kernels
+                model = model.to(memory_format=torch.channels_last)
+            ort_model = export_to_onnx_runtime(model, INPUT_SIZES[transform_key], device) if ONNX_RUNTIME else None
+            if ort_model is not None:
+                model = ort_model
+                backend = 'tensorrt' if ort_model.provider == 'TensorrtExecutionProvider' else 'onnxruntime'
+            else:
+                if QUANTIZE_CPU:
+                    model = quantize_for_cpu(model, device, INPUT_SIZES[transform_key],
+                                             os.path.join(os.path.dirname(model_path), 'calib'))
+                if TORCH_COMPILE:
+                    model = compile_for_inference(model, INPUT_SIZES[transform_key], device,
+                                                  optimize=JIT_OPTIMIZE)
+                backend = 'torch'
+            model_name = os.path.splitext(model_file)[0]
             models[model_name] = model            
+            input_size = INPUT_SIZES[transform_key]
+            staging_buffers[model_name] = StagingBuffer((3, input_size, input_size), device,
+                                                        capacity=batch_scheduler.max_batch_size)
+            batch_scheduler.register(model, staging_buffers[model_name])
             model_info[model_name] = {
                 'type': model_type,
                 'transform_key': transform_key,
                 'file_path': model_path,
-                'parameters': sum(p.numel() for p in model.parameters())
+                'parameters': num_parameters,
+                'backend': backend
             }
             
             # Also add short name mapping for compatibility
-            if 'tiny' in model_file.lower():
+            if 'separable' in model_file.lower():
+                short_name = 'tiny_separable'
+            elif 'tiny' in model_file.lower():
                 short_name = 'tiny'
             elif 'nano' in model_file.lower():
                 short_name = 'nano'
@@ -118,11 +264,26 @@ def load_models():
             if short_name:
                 models[short_name] = model
                 model_info[short_name] = model_info[model_name].copy()
+                staging_buffers[short_name] = staging_buffers[model_name]
                 print(f"Loaded {model_type} model: {model_name} (also available as '{short_name}')")
             else:
                 print(f"Loaded {model_type} model: {model_name}")
         except Exception as e:
             print(f"Error loading model {model_file} from {model_path}: {e}")
+    resolved_models = {
+        name: SimpleNamespace(
+            model=model,
+            transform=transforms_dict[model_info[name]['transform_key']],
+            file_path=model_info[name]['file_path'],
+            model_used={
+                'name': name,
+                'type': model_info[name]['type'],
+                'parameters': model_info[name]['parameters']
+            }
+        )
+        for name, model in models.items()
+    }
+    default_model_name = next(iter(models), None)
     print(f"Successfully loaded {len(models)} models")
 
 @app.route('/health', methods=['GET'])
@@ -158,22 +319,24 @@ def predict_image():
     Supports both file upload and URL
     """
     try:
-        model_name = request.form.get('model', list(models.keys())[0] if models else None)
-        if not models:
+        model_name = request.form.get('model', default_model_name)
+        if not resolved_models:
             return jsonify(format_api_response(
                 success=False,
                 error="No models loaded. Please load models first.",
                 message="Model loading required"
             )), 500
-        if model_name not in models:
+        entry = resolved_models.get(model_name)
+        if entry is None:
             return jsonify(format_api_response(
                 success=False,
-                error=f"Model '{model_name}' not found. Available models: {list(models.keys())}",
+                error=f"Model '{model_name}' not found. Available models: {list(resolved_models)}",
                 message="Invalid model selection"
             )), 400
-        model = models[model_name]
-        transform_key = model_info[model_name]['transform_key']
-        transform = transforms_dict[transform_key]        
+        model, transform = entry.model, entry.transform
+        model_file = entry.file_path
+        use_cache = _cache_lookup_enabled()
+        prediction_result = None
         image_url = request.form.get('image_url')
         if image_url:
             if not is_valid_url(image_url):
@@ -182,7 +345,19 @@ def predict_image():
                     error="Invalid image URL provided",
                     message="URL validation failed"
                 )), 400            
-            image = download_image_from_url(image_url)
+            cache_key = (model_file, 'url', image_url)
+            image = None
+            if use_cache:
+                prediction_result = prediction_cache.get(cache_key)
+                if prediction_result is not None and url_validators.is_stale(image_url):
+                    # Conditional GET: a 304 keeps the cached prediction, a changed image is re-scored
+                    image = download_image_from_url(image_url, target_size=transform.size,
+                                                    validators=url_validators, revalidate=True)
+                    if image is not None:
+                        prediction_result = None
+            if prediction_result is None and image is None:
+                image = download_image_from_url(image_url, target_size=transform.size,
+                                                validators=url_validators)
             source = "url"
             source_value = image_url        
         elif 'image' in request.files:
@@ -202,7 +377,12 @@ def predict_image():
                     error="Expected image file, got: " + file_type_or_error,
                     message="Wrong file type"
                 )), 400            
-            image = Image.open(file.stream).convert('RGB')
+            # Hash and decode straight from the (spooled) upload stream rather than a bytes copy
+            cache_key = (model_file, 'blake2b', content_digest(file.stream))
+            if use_cache:
+                prediction_result = prediction_cache.get(cache_key)
+            if prediction_result is None:
+                image = decode_upload(file.stream, transform.size, device)
             source = "upload"
             source_value = file.filename
         
@@ -212,27 +392,23 @@ def predict_image():
                 error="No image provided. Use 'image' file upload or 'image_url' parameter.",
                 message="Missing image input"
             )), 400        
-        prediction_result = predict_single_image(
-            model=model,
-            image=image,
-            transform=transform,
-            device=device
-        )        
+        if prediction_result is None:
+            # Preprocess on the request thread; the scheduler batches the forward pass with other requests
+            probabilities = batch_scheduler.submit(model, transform(image)).result(timeout=PREDICT_TIMEOUT)
+            prediction_result = format_prediction(probabilities)
+            prediction_cache.put(cache_key, prediction_result)
         response_data = {
             'prediction': prediction_result,
-            'model_used': {
-                'name': model_name,
-                'type': model_info[model_name]['type'],
-                'parameters': model_info[model_name]['parameters']
-            },
+            'model_used': entry.model_used,
             'source': {
                 'type': source,
                 'value': source_value
             }
         }        
         try:
-            result_file = save_prediction_result(response_data, "image")
-            response_data['result_saved_to'] = result_file
+            result_file = save_prediction_result_async(response_data, "image")
+            if result_file:
+                response_data['result_saved_to'] = result_file
         except Exception as e:
             print(f"Warning: Could not save result to file: {e}")
         
@@ -242,6 +418,8 @@ def predict_image():
             message="Image prediction completed successfully"
         ))
     
+    except SchedulerOverloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         error_msg = str(e)
         traceback.print_exc()
@@ -254,23 +432,21 @@ def predict_image():
 @app.route('/predict/video', methods=['POST'])
 def predict_video():
     try:
-        model_name = request.form.get('model', list(models.keys())[0] if models else None)
-        if not models:
+        model_name = request.form.get('model', default_model_name)
+        if not resolved_models:
             return jsonify(format_api_response(
                 success=False,
                 error="No models loaded. Please load models first.",
                 message="Model loading required"
             )), 500
-        if model_name not in models:
+        entry = resolved_models.get(model_name)
+        if entry is None:
             return jsonify(format_api_response(
                 success=False,
-                error=f"Model '{model_name}' not found. Available models: {list(models.keys())}",
+                error=f"Model '{model_name}' not found. Available models: {list(resolved_models)}",
                 message="Invalid model selection"
             )), 400
-        
-        model = models[model_name]
-        transform_key = model_info[model_name]['transform_key']
-        transform = transforms_dict[transform_key]        
+        model, transform = entry.model, entry.transform
         max_frames = min(20, int(request.form.get('max_frames', 10)))
         video_path = None        
         try:
@@ -282,7 +458,9 @@ def predict_video():
                         error="Invalid video URL provided",
                         message="URL validation failed"
                     )), 400                
-                video_path = download_video_from_url(video_url)
+                video = download_video_from_url(video_url, in_memory=IN_MEMORY_VIDEO_DECODE)
+                if not IN_MEMORY_VIDEO_DECODE:
+                    video_path = video
                 source = "url"
                 source_value = video_url            
             elif 'video' in request.files:
@@ -300,9 +478,15 @@ def predict_video():
                         error="Expected video file, got: " + file_type_or_error,
                         message="Wrong file type"
                     )), 400                
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as tmp_file:
-                    file.save(tmp_file.name)
-                    video_path = tmp_file.name
+                if IN_MEMORY_VIDEO_DECODE:
+                    # PyAV reads the spooled upload directly, no extra copy to /tmp
+                    video = file.stream
+                    video.seek(0)
+                else:
+                    with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as tmp_file:
+                        # Copy the spooled upload to disk in 1 MB chunks
+                        file.save(tmp_file, buffer_size=1 << 20)
+                        video_path = video = tmp_file.name
                 source = "upload"
                 source_value = file.filename
             else:
@@ -312,7 +496,7 @@ def predict_video():
                     message="Missing video input"
                 )), 400
             
-            frames = extract_video_frames(video_path, max_frames=max_frames)            
+            frames = extract_video_frames(video, max_frames=max_frames, device=device)            
             prediction_result = predict_multiple_images(
                 model=model,
                 images=frames,
@@ -325,19 +509,16 @@ def predict_video():
                     'frames_analyzed': len(frames),
                     'max_frames_requested': max_frames
                 },
-                'model_used': {
-                    'name': model_name,
-                    'type': model_info[model_name]['type'],
-                    'parameters': model_info[model_name]['parameters']
-                },
+                'model_used': entry.model_used,
                 'source': {
                     'type': source,
                     'value': source_value
                 }
             }
             try:
-                result_file = save_prediction_result(response_data, "video")
-                response_data['result_saved_to'] = result_file
+                result_file = save_prediction_result_async(response_data, "video")
+                if result_file:
+                    response_data['result_saved_to'] = result_file
             except Exception as e:
                 print(f"Warning: Could not save result to file: {e}")
             return jsonify(format_api_response(
@@ -358,104 +539,124 @@ def predict_video():
             message="Error during video prediction"
         )), 500
 
+def _download_url_image(url, target_size=None):
+    """download_image_from_url that records the URL's validators for later revalidation"""
+    return download_image_from_url(url, target_size=target_size, validators=url_validators)
+
+
+def _decode_batch_upload(stream, target_size=None):
+    return decode_upload(stream, target_size, device)
+
+
+def _load_batch_image(load, source, transform):
+    """Open one batch input (URL or upload stream) and return its model-ready tensor"""
+    return transform(load(source, target_size=transform.size))
+
 @app.route('/predict/batch', methods=['POST'])
 def predict_batch():
     try:
-        model_name = request.form.get('model', list(models.keys())[0] if models else None)
-        if not models:
+        model_name = request.form.get('model', default_model_name)
+        if not resolved_models:
             return jsonify(format_api_response(
                 success=False,
                 error="No models loaded. Please load models first.",
                 message="Model loading required"
             )), 500
-        
-        if model_name not in models:
+        entry = resolved_models.get(model_name)
+        if entry is None:
             return jsonify(format_api_response(
                 success=False,
-                error=f"Model '{model_name}' not found. Available models: {list(models.keys())}",
+                error=f"Model '{model_name}' not found. Available models: {list(resolved_models)}",
                 message="Invalid model selection"
             )), 400
-        
-        model = models[model_name]
-        transform_key = model_info[model_name]['transform_key']
-        transform = transforms_dict[transform_key]
-        images = []
-        sources = []        
+        model, transform = entry.model, entry.transform
+        model_file = entry.file_path
+        use_cache = _cache_lookup_enabled()
+        # Each input gets a result entry; failed downloads/decodes are reported in place.
+        # Every image is loaded and transformed as its own task (URLs on the download pool,
+        # uploads on the preprocess pool), so N downloads cost ~max(RTT) rather than sum(RTT);
+        # inputs already in the prediction cache skip all of it.
+        results = []
+        pending = []
+
+        def add_input(source, cache_key, pool, load, image_source):
+            results.append({'index': len(results), 'source': source})
+            cached = prediction_cache.get(cache_key) if use_cache else None
+            if cached is not None and source['type'] == 'url' and url_validators.is_stale(source['value']):
+                # Past the revalidation age: fetch and re-score like a miss
+                cached = None
+            if cached is not None:
+                results[-1]['prediction'] = cached
+                results[-1]['status'] = 'success'
+            else:
+                future = pool.submit(_load_batch_image, load, image_source, transform)
+                pending.append((len(results) - 1, cache_key, future))
+
         image_urls = request.form.getlist('image_urls')
         for url in image_urls:
             if is_valid_url(url):
-                try:
-                    image = download_image_from_url(url)
-                    images.append(image)
-                    sources.append({'type': 'url', 'value': url})
-                except Exception as e:
-                    sources.append({'type': 'url', 'value': url, 'error': str(e)})        
+                add_input({'type': 'url', 'value': url}, (model_file, 'url', url),
+                          DOWNLOAD_POOL, _download_url_image, url)
         uploaded_files = request.files.getlist('images')
         for file in uploaded_files:
             is_valid, file_type_or_error = validate_file_upload(file)
             if is_valid and file_type_or_error == "image":
-                try:
-                    image = Image.open(file.stream).convert('RGB')
-                    images.append(image)
-                    sources.append({'type': 'upload', 'value': file.filename})
-                except Exception as e:
-                    sources.append({'type': 'upload', 'value': file.filename, 'error': str(e)})
+                add_input({'type': 'upload', 'value': file.filename},
+                          (model_file, 'blake2b', content_digest(file.stream)),
+                          PREPROCESS_POOL, _decode_batch_upload, file.stream)
+        tensors = []
+        for i, cache_key, future in pending:
+            try:
+                tensors.append((i, cache_key, future.result()))
+            except Exception as e:
+                results[i]['status'] = 'error'
+                results[i]['error'] = str(e)
         
-        if not images:
+        if tensors:
+            # All images ride the shared batching pipeline as one block
+            stacked = [tensor for _, _, tensor in tensors]
+            if any(tensor.is_cuda for tensor in stacked):
+                # nvJPEG-decoded uploads are already on the GPU; stack there
+                batch = torch.stack([tensor.to(device, non_blocking=True) for tensor in stacked])
+            else:
+                batch = torch.empty((len(stacked), *stacked[0].shape), pin_memory=device.type == 'cuda')
+                torch.stack(stacked, out=batch)
+            probabilities = batch_scheduler.submit_many(model, batch).result(timeout=PREDICT_TIMEOUT)
+            for (i, cache_key, _), prediction in zip(tensors, format_predictions(probabilities)):
+                results[i]['prediction'] = prediction
+                results[i]['status'] = 'success'
+                prediction_cache.put(cache_key, prediction)
+
+        predictions = [r['prediction'] for r in results if r.get('status') == 'success']
+        if not predictions:
             return jsonify(format_api_response(
                 success=False,
                 error="No valid images provided",
                 message="No processable images found"
             )), 400        
-        results = []
-        for i, image in enumerate(images):
-            try:
-                prediction = predict_single_image(
-                    model=model,
-                    image=image,
-                    transform=transform,
-                    device=device
-                )
-                results.append({
-                    'index': i,
-                    'prediction': prediction,
-                    'source': sources[i] if i < len(sources) else None,
-                    'status': 'success'
-                })
-            except Exception as e:
-                results.append({
-                    'index': i,
-                    'source': sources[i] if i < len(sources) else None,
-                    'status': 'error',
-                    'error': str(e)
-                })        
-        successful_predictions = [r for r in results if r['status'] == 'success']
-        if successful_predictions:
-            ai_count = sum(1 for r in successful_predictions if r['prediction']['predicted_class'] == 0)
-            real_count = len(successful_predictions) - ai_count
-            avg_confidence = sum(r['prediction']['confidence'] for r in successful_predictions) / len(successful_predictions)
-        else:
-            ai_count = real_count = avg_confidence = 0
+        successful = len(predictions)
+        predicted_classes = np.fromiter((p['predicted_class'] for p in predictions), dtype=np.int64, count=successful)
+        confidences = np.fromiter((p['confidence'] for p in predictions), dtype=np.float64, count=successful)
+        ai_count = int(np.count_nonzero(predicted_classes == 0))
+        real_count = successful - ai_count
+        avg_confidence = float(confidences.mean())
         
         response_data = {
             'results': results,
             'summary': {
-                'total_images': len(images),
-                'successful_predictions': len(successful_predictions),
-                'failed_predictions': len(results) - len(successful_predictions),
+                'total_images': len(results),
+                'successful_predictions': successful,
+                'failed_predictions': len(results) - successful,
                 'ai_predictions': ai_count,
                 'real_predictions': real_count,
                 'average_confidence': avg_confidence
             },
-            'model_used': {
-                'name': model_name,
-                'type': model_info[model_name]['type'],
-                'parameters': model_info[model_name]['parameters']
-            }
+            'model_used': entry.model_used
         }        
         try:
-            result_file = save_prediction_result(response_data, "batch")
-            response_data['result_saved_to'] = result_file
+            result_file = save_prediction_result_async(response_data, "batch")
+            if result_file:
+                response_data['result_saved_to'] = result_file
         except Exception as e:
             print(f"Warning: Could not save result to file: {e}")
         
@@ -465,6 +666,8 @@ def predict_batch():
             message="Batch prediction completed successfully"
         ))
     
+    except SchedulerOverloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         error_msg = str(e)
         traceback.print_exc()
@@ -524,4 +727,6 @@ if __name__ == '__main__':
     print("  POST /predict/video - Predict video frames")
     print("  POST /predict/batch - Predict multiple images")
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # Development server only; use wsgi.py with gunicorn in production.
+    # The debug reloader would load every model twice, so it is opt-in.
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
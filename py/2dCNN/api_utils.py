@@ -1,19 +1,112 @@
 """
 Utility functions for the Deep Fake Detection API
 """
+import io
 import os
+import copy
+import shutil
 import cv2
 import torch
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import numpy as np
 from PIL import Image
 import torch.nn.functional as F
-from torchvision import transforms
+from torch.nn.utils.fusion import fuse_conv_bn_eval, fuse_linear_bn_eval
+from torchvision.transforms import v2
+from torchvision.io import decode_jpeg, ImageReadMode
 from urllib.parse import urlparse
 import tempfile
 import json
+import queue
+import functools
+import hashlib
+import inspect
+import threading
+import time
+from types import MappingProxyType
+from collections import OrderedDict
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, Future
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib encoder
+    orjson = None
+
+try:
+    import onnx  # noqa: F401  (torch.onnx.export needs it)
+    import onnxruntime as ort
+except ImportError:  # serve with PyTorch only
+    ort = None
+
+try:
+    from safetensors.torch import load_file as load_safetensors
+except ImportError:  # only .pth checkpoints can be loaded
+    load_safetensors = None
+
+try:
+    import av
+except ImportError:  # decode videos with OpenCV only
+    av = None
+
+try:
+    from torchcodec.decoders import VideoDecoder
+except ImportError:  # no NVDEC decoding into GPU memory
+    VideoDecoder = None
+
+# PyAV can decode straight from an upload stream or BytesIO; OpenCV needs a file on disk
+IN_MEMORY_VIDEO_DECODE = av is not None
+# Set once the missing-PyAV fallback has been reported
+_warned_no_av = False
+
+# Max images per forward pass when predicting several images at once
+INFERENCE_BATCH_SIZE = 16
+
+# Dynamic batching of concurrent requests (see BatchScheduler)
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', '32'))
+BATCH_TIMEOUT_MS = float(os.environ.get('BATCH_TIMEOUT_MS', '5'))
+# Requests allowed to wait per model before new ones are rejected (0 = unbounded)
+MAX_QUEUE_DEPTH = int(os.environ.get('MAX_QUEUE_DEPTH', '256'))
+
+# Shared pool for CPU-side preprocessing; PIL resize and tensor conversion release the GIL
+PREPROCESS_POOL = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1),
+                                     thread_name_prefix='preprocess')
+
+# Separate pool for URL fetches: they mostly wait on the network, so they get more threads
+# (matching the HTTP connection pool below) without tying up the CPU preprocess workers
+DOWNLOAD_POOL = ThreadPoolExecutor(max_workers=32, thread_name_prefix='download')
+
+# Result files are written off the request path; at most MAX_PENDING_SAVES writes may
+# be queued, beyond that results are dropped (with a warning) rather than piling up
+SAVE_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix='save')
+MAX_PENDING_SAVES = 1024
+_SAVE_SLOTS = threading.BoundedSemaphore(MAX_PENDING_SAVES)
+
+# Shared HTTP session so repeated downloads from the same host (e.g. MinIO) reuse
+# keep-alive connections instead of paying a TCP/TLS handshake per request
+_SESSION = requests.Session()
+_SESSION.headers.update({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+})
+# Enough pooled connections per host for every DOWNLOAD_POOL worker; idempotent GETs are
+# retried with backoff on connection errors and transient gateway failures
+_http_adapter = HTTPAdapter(
+    pool_connections=64, pool_maxsize=64,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset({'GET'}))
+)
+_SESSION.mount('http://', _http_adapter)
+_SESSION.mount('https://', _http_adapter)
+# Images and videos are already compressed, so don't let servers gzip them again
+_DOWNLOAD_HEADERS = {'Accept-Encoding': 'identity'}
+# Seconds to wait for a connection; the read timeout is the caller's timeout argument
+CONNECT_TIMEOUT = 5
+# Largest remote file we will fetch (same cap as direct uploads)
+MAX_DOWNLOAD_BYTES = int(os.environ.get('MAX_DOWNLOAD_BYTES', str(100 * 1024 * 1024)))
+
 
 def is_valid_url(url):
     """Check if the provided string is a valid URL"""
@@ -24,31 +117,94 @@ def is_valid_url(url):
         return False
 
 
-def download_image_from_url(url, timeout=30):
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=timeout, stream=True)
+def open_image(source, target_size=None):
+    """
+    Open an image file/stream as RGB. With a target_size, JPEGs are decoded at a reduced
+    DCT scale (1/2, 1/4 or 1/8) that still leaves at least 2x the model input, which is
+    much cheaper than a full-size decode followed by a large downscale.
+    """
+    image = Image.open(source)
+    if target_size:
+        image.draft('RGB', (target_size * 2, target_size * 2))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+
+# Decode JPEG uploads with nvJPEG on CUDA hosts (set NVJPEG=0 to always use PIL)
+NVJPEG = os.environ.get('NVJPEG', '1') != '0'
+
+
+def decode_upload(stream, target_size, device):
+    """
+    Decode an uploaded image stream. On CUDA, JPEGs are decoded by nvJPEG straight into
+    a (3, H, W) uint8 tensor on the device, which the transforms resize and normalize
+    there; other formats (or a failed GPU decode) go through open_image.
+    """
+    if NVJPEG and device.type == 'cuda':
+        stream.seek(0)
+        if stream.read(3) == b'\xff\xd8\xff':
+            stream.seek(0)
+            data = torch.frombuffer(bytearray(stream.read()), dtype=torch.uint8)
+            try:
+                return decode_jpeg(data, mode=ImageReadMode.RGB, device=device)
+            except RuntimeError as e:
+                print(f"nvJPEG decode failed, falling back to PIL: {e}")
+        stream.seek(0)
+    return open_image(stream, target_size)
+
+
+def _download_to(url, out, timeout, chunk_size, headers=None):
+    """
+    Stream the body of url into the file-like out; returns the response headers,
+    or None for a 304 Not Modified answer to a conditional request
+    """
+    request_headers = dict(_DOWNLOAD_HEADERS, **headers) if headers else _DOWNLOAD_HEADERS
+    with _SESSION.get(url, timeout=(CONNECT_TIMEOUT, timeout), stream=True,
+                      headers=request_headers) as response:
+        if response.status_code == 304:
+            return None
         response.raise_for_status()
-        
+        # Reject oversize files up front when the server tells us the size,
+        # and keep counting in case it doesn't (or lies)
+        content_length = response.headers.get('Content-Length')
+        if content_length and content_length.isdigit() and int(content_length) > MAX_DOWNLOAD_BYTES:
+            raise ValueError(f"Remote file is too large ({content_length} bytes, limit {MAX_DOWNLOAD_BYTES})")
+        received = 0
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            received += len(chunk)
+            if received > MAX_DOWNLOAD_BYTES:
+                raise ValueError(f"Remote file exceeds the {MAX_DOWNLOAD_BYTES} byte limit")
+            out.write(chunk)
+        return response.headers
+
+
+def download_image_from_url(url, timeout=30, target_size=None, validators=None, revalidate=False):
+    """
+    Download and open an image. With a URLValidators cache the response's ETag /
+    Last-Modified are recorded; revalidate=True sends them as a conditional GET and
+    returns None if the server answers 304 (the caller's cached result is still good).
+    """
+    try:
+        # Decode straight from memory; images are small enough that a temp file only adds disk I/O
+        buffer = io.BytesIO()
+        headers = validators.conditional_headers(url) if revalidate and validators is not None else None
+        response_headers = _download_to(url, buffer, timeout, chunk_size=65536, headers=headers)
+        if response_headers is None:
+            if validators is not None:
+                validators.touch(url)
+            return None
+        if validators is not None:
+            validators.update(url, response_headers)
         # Note: MinIO and some storage systems return 'application/octet-stream' by default
         # We'll try to open the image anyway and let PIL validate if it's actually an image
-        content_type = response.headers.get('content-type', '')
-        print(f"[DEBUG] Downloaded content with Content-Type: {content_type}")
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-            for chunk in response.iter_content(chunk_size=8192):
-                tmp_file.write(chunk)
-            tmp_path = tmp_file.name
+        print(f"[DEBUG] Downloaded content with Content-Type: {response_headers.get('content-type', '')}")
+        buffer.seek(0)
         
         try:
             # PIL will raise an exception if this is not a valid image
-            image = Image.open(tmp_path).convert('RGB')
-            os.unlink(tmp_path)
-            return image
+            return open_image(buffer, target_size)
         except Exception as img_err:
-            os.unlink(tmp_path)
             raise ValueError(f"Downloaded file is not a valid image: {img_err}")
             
     except requests.exceptions.RequestException as e:
@@ -56,26 +212,211 @@ def download_image_from_url(url, timeout=30):
     except Exception as e:
         raise Exception(f"Error processing image from URL: {str(e)}")
 
-def extract_video_frames(video_path, max_frames=10, frame_interval=30):
+# Seeking costs a keyframe decode, so only seek when the next target frame is
+# further away than this; shorter gaps are skipped with grab(), which skips the BGR conversion
+_SEEK_MIN_GAP = 48
+
+
+def _read_sampled_frames(cap, target_indices, frame_queue, errors):
+    """Producer: decode the sampled BGR frames in order and push them onto frame_queue"""
     try:
-        cap = cv2.VideoCapture(video_path)
+        position = 0
+        for idx in target_indices:
+            idx = int(idx)
+            if idx - position > _SEEK_MIN_GAP and cap.set(cv2.CAP_PROP_POS_FRAMES, idx):
+                position = idx
+            while position < idx and cap.grab():
+                position += 1
+            if position < idx:
+                break
+            ret, frame = cap.read()
+            if not ret:
+                break
+            position += 1
+            frame_queue.put(frame)
+    except Exception as e:
+        errors.append(e)
+    finally:
+        frame_queue.put(None)
+
+
+def _bgr_to_tensor(frame):
+    """BGR HWC frame -> RGB uint8 CHW tensor, the layout the transforms take directly"""
+    return torch.from_numpy(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)).permute(2, 0, 1)
+
+
+# Hardware decoder PyAV should try first (e.g. 'cuda' for NVDEC); empty disables it.
+# Decoding falls back to software when the codec or device is not supported.
+VIDEO_HWACCEL = os.environ.get('VIDEO_HWACCEL', 'cuda' if torch.cuda.is_available() else '')
+
+
+# Sample the keyframe nearest (at or before) each target instead of the exact frame: only
+# intra-coded frames get decoded. Falls back to exact sampling when keyframes are too sparse.
+VIDEO_KEYFRAMES_ONLY = os.environ.get('VIDEO_KEYFRAMES_ONLY', '1') != '0'
+
+
+def _av_frame_to_tensor(frame):
+    return torch.from_numpy(frame.to_ndarray(format='rgb24')).permute(2, 0, 1)
+
+
+def _keyframes_av(container, stream, targets, max_frames):
+    """
+    Decode only the keyframe at or before each target timestamp (seek lands on it, and the
+    decoder skips every non-key frame). Returns None when the video has too few distinct
+    keyframes in range (e.g. long GOPs), so the caller can sample exact frames instead.
+    """
+    stream.codec_context.skip_frame = 'NONKEY'
+    try:
+        frames = []
+        seen = set()
+        for target in targets:
+            container.seek(int(target), stream=stream)
+            frame = next(container.decode(stream), None)
+            if frame is None:
+                break
+            if frame.pts in seen:
+                continue
+            seen.add(frame.pts)
+            frames.append(_av_frame_to_tensor(frame))
+    finally:
+        stream.codec_context.skip_frame = 'DEFAULT'
+    return frames if len(frames) >= max_frames else None
+
+
+def _extract_frames_av(video, max_frames):
+    """PyAV decoder: seek by timestamp to each sampled frame instead of decoding the whole stream"""
+    options = {}
+    if VIDEO_HWACCEL:
+        options['hwaccel'] = av.codec.hwaccel.HWAccel(VIDEO_HWACCEL, allow_software_fallback=True)
+    with av.open(video, **options) as container:
+        stream = container.streams.video[0]
+        stream.thread_type = 'AUTO'
+        duration = stream.duration
+        if not duration and container.duration and stream.time_base:
+            # WebM/MKV carry no per-stream duration; rescale the container's (AV_TIME_BASE units)
+            duration = int(container.duration / av.time_base / stream.time_base)
+        total_frames = stream.frames
+        if not total_frames and duration and stream.average_rate:
+            total_frames = int(duration * stream.time_base * stream.average_rate)
+        if not duration or not total_frames:
+            # Length unknown: let OpenCV sample instead of returning only the opening frames
+            return None
+        if total_frames <= max_frames:
+            return [_av_frame_to_tensor(f) for f in islice(container.decode(stream), max_frames)]
+
+        start = stream.start_time or 0
+        # Same frame indices as the OpenCV path, converted to stream timestamps
+        indices = np.linspace(0, total_frames - 1, max_frames)
+        targets = start + (indices * duration / total_frames).astype(np.int64)
+        if VIDEO_KEYFRAMES_ONLY:
+            frames = _keyframes_av(container, stream, targets, max_frames)
+            if frames is not None:
+                return frames
+        seek_gap = duration * _SEEK_MIN_GAP // total_frames
         frames = []
-        frame_count = 0
+        decoder = None
+        position = start
+        for target in targets:
+            target = int(target)
+            if decoder is None or target - position > seek_gap:
+                container.seek(target, stream=stream)
+                decoder = container.decode(stream)
+            for frame in decoder:
+                if frame.pts is None or frame.pts >= target:
+                    frames.append(_av_frame_to_tensor(frame))
+                    position = target if frame.pts is None else frame.pts
+                    break
+            else:
+                break
+        return frames
+
+
+def _spool_to_temp(stream):
+    """Copy a video stream to a temp file for decoders that need a path; returns the path"""
+    stream.seek(0)
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as tmp_file:
+        shutil.copyfileobj(stream, tmp_file, length=1 << 20)
+        return tmp_file.name
+
+
+def _extract_frames_torchcodec(video, max_frames, device):
+    """TorchCodec on NVDEC: the sampled frames are decoded straight into device memory"""
+    decoder = VideoDecoder(video, device=str(device))
+    total_frames = decoder.metadata.num_frames or 0
+    if total_frames <= max_frames:
+        indices = list(range(total_frames))
+    else:
+        indices = np.linspace(0, total_frames - 1, max_frames, dtype=int).tolist()
+    return list(decoder.get_frames_at(indices).data.unbind(0))
+
+
+def extract_video_frames(video, max_frames=10, frame_interval=30, device=None):
+    """
+    Sample up to max_frames evenly spaced frames as RGB uint8 (3, H, W) tensors.
+    video is a file path or a seekable binary stream; streams are decoded in memory by
+    PyAV and only written to a temp file if OpenCV has to take over. With a CUDA device
+    and TorchCodec installed, frames are decoded by NVDEC and returned on the GPU.
+    """
+    if VideoDecoder is not None and device is not None and device.type == 'cuda' and VIDEO_HWACCEL == 'cuda':
+        try:
+            frames = _extract_frames_torchcodec(video, max_frames, device)
+            if frames:
+                return frames
+        except Exception as e:
+            print(f"TorchCodec GPU decode failed, falling back to CPU decoding: {e}")
+        if not isinstance(video, (str, os.PathLike)):
+            video.seek(0)
+    global _warned_no_av
+    if av is not None:
+        try:
+            frames = _extract_frames_av(video, max_frames)
+            if frames:
+                return frames
+            print("PyAV could not sample the video, falling back to OpenCV")
+        except Exception as e:
+            print(f"PyAV decode failed, falling back to OpenCV: {e}")
+    elif not _warned_no_av:
+        _warned_no_av = True
+        print("Warning: PyAV is not installed (pip install 'av>=14'); decoding videos with OpenCV")
+    if isinstance(video, (str, os.PathLike)):
+        return _extract_frames_cv2(video, max_frames)
+    video_path = _spool_to_temp(video)
+    try:
+        return _extract_frames_cv2(video_path, max_frames)
+    finally:
+        cleanup_temp_files(video_path)
+
+
+def _extract_frames_cv2(video_path, max_frames):
+    try:
+        cap = cv2.VideoCapture(video_path)
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
         if total_frames <= max_frames:
-            interval = 1
+            # Short (or unknown length) video: take frames in order until we run out
+            target_indices = range(max_frames)
         else:
-            interval = max(1, total_frames // max_frames)
-        while cap.isOpened() and len(frames) < max_frames:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            if frame_count % interval == 0:
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                pil_image = Image.fromarray(frame_rgb)
-                frames.append(pil_image)
-            frame_count += 1
-        cap.release()
+            target_indices = np.linspace(0, total_frames - 1, max_frames, dtype=int)
+
+        # Decode on a producer thread while the preprocess pool converts finished frames;
+        # cv2 releases the GIL in both, so decode and colour conversion overlap
+        frame_queue = queue.Queue(maxsize=16)
+        errors = []
+        producer = threading.Thread(target=_read_sampled_frames,
+                                    args=(cap, target_indices, frame_queue, errors), daemon=True)
+        producer.start()
+        try:
+            pending = []
+            while True:
+                frame = frame_queue.get()
+                if frame is None:
+                    break
+                pending.append(PREPROCESS_POOL.submit(_bgr_to_tensor, frame))
+            frames = [f.result() for f in pending]
+        finally:
+            producer.join()
+            cap.release()
+        if errors:
+            raise errors[0]
         if not frames:
             raise ValueError("No frames could be extracted from the video")
         return frames
@@ -83,133 +424,863 @@ def extract_video_frames(video_path, max_frames=10, frame_interval=30):
         raise Exception(f"Error extracting frames from video: {str(e)}")
 
 
-def download_video_from_url(url, timeout=60):
+def download_video_from_url(url, timeout=60, in_memory=False):
+    """Download a video to a temp file and return its path, or to a BytesIO with in_memory=True"""
+    tmp_path = None
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=timeout, stream=True)
-        response.raise_for_status()        
+        if in_memory:
+            buffer = io.BytesIO()
+            _download_to(url, buffer, timeout, chunk_size=1 << 20)
+            buffer.seek(0)
+            return buffer
         with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as tmp_file:
-            for chunk in response.iter_content(chunk_size=8192):
-                tmp_file.write(chunk)
             tmp_path = tmp_file.name
+            _download_to(url, tmp_file, timeout, chunk_size=1 << 20)
         return tmp_path
     except requests.exceptions.RequestException as e:
+        cleanup_temp_files(tmp_path)
         raise Exception(f"Failed to download video from URL: {str(e)}")
     except Exception as e:
+        cleanup_temp_files(tmp_path)
         raise Exception(f"Error processing video from URL: {str(e)}")
 
 
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+# Square input resolution expected by each transform key
+INPUT_SIZES = {
+    'standard': 224,
+    'tiny': 64,
+    'nano': 32
+}
+
+
+class FusedTransform:
+    """
+    Resize + rescale + normalize + HWC->CHW in one pass over the pixels.
+    PIL images go through a per-channel uint8 -> float32 lookup table written straight
+    into a CHW array; uint8 tensors of shape (..., 3, H, W), e.g. a stacked batch of video
+    frames on the GPU, are resized and normalized with a single fused multiply-add.
+    """
+    def __init__(self, size, mean=IMAGENET_MEAN, std=IMAGENET_STD):
+        self.size = size
+        mean = np.asarray(mean, dtype=np.float32)
+        std = np.asarray(std, dtype=np.float32)
+        # lut[c, v] == (v / 255 - mean[c]) / std[c]
+        self._lut = (np.arange(256, dtype=np.float32)[None, :] / 255.0 - mean[:, None]) / std[:, None]
+        # Same mapping as x * scale + shift for the tensor path, cached per device
+        scale = torch.from_numpy(1.0 / (255.0 * std)).view(-1, 1, 1)
+        shift = torch.from_numpy(-mean / std).view(-1, 1, 1)
+        self._device_stats = {torch.device('cpu'): (scale, shift)}
+
+    def __call__(self, image):
+        if isinstance(image, torch.Tensor):
+            return self._transform_tensor(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        if image.size != (self.size, self.size):
+            image = image.resize((self.size, self.size), Image.BILINEAR)
+        pixels = np.asarray(image)
+        out = np.empty((3, self.size, self.size), dtype=np.float32)
+        for c in range(3):
+            np.take(self._lut[c], pixels[..., c], out=out[c])
+        return torch.from_numpy(out)
+
+    def _transform_tensor(self, x):
+        if x.shape[-2:] != (self.size, self.size):
+            x = v2.functional.resize(x, [self.size, self.size], antialias=True)
+        stats = self._device_stats.get(x.device)
+        if stats is None:
+            # The same transform serves CPU images and GPU batches, so keep a copy per device
+            cpu_scale, cpu_shift = self._device_stats[torch.device('cpu')]
+            stats = self._device_stats[x.device] = (cpu_scale.to(x.device), cpu_shift.to(x.device))
+        scale, shift = stats
+        return torch.addcmul(shift, x.to(torch.float32), scale)
+
+
+@functools.lru_cache(maxsize=1)
 def get_image_transforms():
-    standard_transform = transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-    ])    
-    tiny_transform = transforms.Compose([
-        transforms.Resize((64, 64)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-    ])
-    nano_transform = transforms.Compose([
-        transforms.Resize((32, 32)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-    ])
+    # Built once and shared read-only by every request
+    return MappingProxyType({key: FusedTransform(size) for key, size in INPUT_SIZES.items()})
+
+
+def _to_uint8_tensor(image):
+    """Convert a PIL image to a uint8 CHW tensor without running the full transform"""
+    if isinstance(image, torch.Tensor):
+        return image
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return v2.functional.pil_to_tensor(image)
+
+
+# Checkpoint formats load_models picks up, in order of preference for the same model name
+CHECKPOINT_EXTENSIONS = ('.safetensors', '.pth') if load_safetensors is not None else ('.pth',)
+
+
+def load_checkpoint(path, device=None):
+    """
+    Load a state_dict memory-mapped from disk: tensors are paged in as they are copied
+    to the model rather than read into a separate RAM buffer first. .safetensors files
+    are mapped straight onto the target device (and never unpickled); .pth files load on CPU.
+    """
+    if path.endswith('.safetensors'):
+        return load_safetensors(path, device=str(device or 'cpu'))
+    try:
+        return torch.load(path, map_location='cpu', mmap=True, weights_only=True)
+    except Exception as e:
+        # Legacy (non-zipfile) checkpoints can't be memory-mapped
+        print(f"Memory-mapped load failed for {path}, reading it normally: {e}")
+        return torch.load(path, map_location='cpu')
+
+
+def fuse_conv_bn(model):
+    """
+    Fold every Conv2d -> BatchNorm2d (and Linear -> BatchNorm1d) pair inside any
+    nn.Sequential of the model, including nested ones, so BN costs nothing at inference.
+    The BN slot becomes nn.Identity to keep layer indices stable. The model must already
+    be in eval mode.
+    """
+    for container in model.modules():
+        if not isinstance(container, torch.nn.Sequential):
+            continue
+        for i in range(len(container) - 1):
+            layer, bn = container[i], container[i + 1]
+            if isinstance(layer, torch.nn.Conv2d) and isinstance(bn, torch.nn.BatchNorm2d):
+                container[i] = fuse_conv_bn_eval(layer, bn)
+            elif isinstance(layer, torch.nn.Linear) and isinstance(bn, torch.nn.BatchNorm1d):
+                container[i] = fuse_linear_bn_eval(layer, bn)
+            else:
+                continue
+            container[i + 1] = torch.nn.Identity()
+    return model
+
+
+# Most calibration images used for static INT8 quantization
+CALIBRATION_IMAGES = 64
+# A quantized model is only swapped in if its top-1 class matches the FP32 model on at
+# least this fraction of the calibration images
+QUANTIZATION_MIN_AGREEMENT = 0.98
+
+
+def _load_calibration_batch(calibration_dir, input_size):
+    """Preprocessed (N, 3, S, S) batch from the images in calibration_dir, or None if there are none"""
+    if not calibration_dir or not os.path.isdir(calibration_dir):
+        return None
+    files = sorted(
+        os.path.join(calibration_dir, f) for f in os.listdir(calibration_dir)
+        if os.path.splitext(f)[1].lower().lstrip('.') in ALLOWED_IMAGE_EXTENSIONS
+    )[:CALIBRATION_IMAGES]
+    if not files:
+        return None
+    transform = FusedTransform(input_size)
+    return torch.stack([transform(open_image(f, input_size)) for f in files])
+
+
+def _top1_agreement(reference, candidate, batch):
+    """Fraction of rows where both models predict the same class, and the largest softmax gap"""
+    with torch.inference_mode():
+        expected = F.softmax(reference(batch).float(), dim=1)
+        actual = F.softmax(candidate(batch).float(), dim=1)
+    agreement = (expected.argmax(dim=1) == actual.argmax(dim=1)).float().mean().item()
+    return agreement, (expected - actual).abs().max().item()
+
+
+def quantize_for_cpu(model, device, input_size=None, calibration_dir=None):
+    """
+    Quantize a loaded model to INT8 for CPU serving. With calibration images (e.g. a
+    calib/ folder next to the checkpoint) the convs and Linear layers are statically
+    quantized, which lets the int8 conv kernels do the work; without them only the Linear
+    layers are dynamically quantized. With calibration images the quantized model is
+    checked against the FP32 one first and rejected if its top-1 predictions drift.
+    CUDA models are returned unchanged.
+    """
+    if device.type != 'cpu':
+        return model
+    calibration = _load_calibration_batch(calibration_dir, input_size) if input_size else None
+
+    def accept(quantized, kind):
+        if calibration is None:
+            return True
+        agreement, max_delta = _top1_agreement(model, quantized, calibration)
+        print(f"{kind} INT8 check: top-1 agreement {agreement:.1%}, max probability delta {max_delta:.4f}")
+        if agreement < QUANTIZATION_MIN_AGREEMENT:
+            print(f"Warning: {kind} INT8 model disagrees with FP32 too often, not using it")
+            return False
+        return True
+
+    if calibration is not None:
+        try:
+            from torch.ao.quantization import get_default_qconfig_mapping
+            from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+            prepared = prepare_fx(copy.deepcopy(model), get_default_qconfig_mapping('x86'),
+                                  (calibration[:1],))
+            with torch.inference_mode():
+                for start in range(0, calibration.shape[0], INFERENCE_BATCH_SIZE):
+                    prepared(calibration[start:start + INFERENCE_BATCH_SIZE])
+            quantized = convert_fx(prepared)
+            # Quantized modules hold packed weights rather than parameters
+            quantized.input_dtype = torch.float32
+            print(f"Statically quantized to INT8 with {calibration.shape[0]} calibration images")
+            if accept(quantized, 'Static'):
+                return quantized
+        except Exception as e:
+            print(f"Warning: static INT8 quantization failed, falling back to dynamic: {e}")
+    try:
+        quantized = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    except Exception as e:
+        print(f"Warning: INT8 quantization failed, using FP32 model: {e}")
+        return model
+    return quantized if accept(quantized, 'Dynamic') else model
+
+
+def compile_for_inference(model, input_size, device, warmup_iters=3, optimize=False):
+    """
+    Compile a loaded model for serving so the forward pass skips per-op Python dispatch.
+    On CUDA this is torch.compile(mode='reduce-overhead'), which captures the forward as
+    a CUDA graph and replays it per request; for these tiny CNNs kernel launch overhead
+    dominates batch=1 latency. On CPU (or when torch.compile is unavailable or fails) the
+    model is traced and frozen with TorchScript instead, which benchmarks faster than
+    inductor here and does not pay a long compile at startup.
+    With optimize=True the frozen module also goes through torch.jit.optimize_for_inference
+    (MKLDNN layouts / fused conv ops): on CPU it was ~1.1-1.9x faster at batch 16 but slower
+    at batch 1 for these models, so it is left to the caller.
+    Warm-up runs here so the first request does not pay for compilation. Returns the
+    eager model if neither path works.
+    """
+    if device.type not in ('cuda', 'cpu'):
+        return model
+    dtype = _model_dtype(model)
+    example = torch.zeros(1, 3, input_size, input_size, device=device, dtype=dtype)
+    if device.type == 'cuda':
+        example = example.contiguous(memory_format=torch.channels_last)
+        if hasattr(torch, 'compile'):
+            try:
+                # fullgraph: a graph break would leave eager islands between CUDA graphs,
+                # so fail over to TorchScript instead of silently running half-compiled
+                compiled = torch.compile(model, mode='reduce-overhead', fullgraph=True)
+                with torch.inference_mode():
+                    # Warm up at batch 1 and at the scheduler's largest batch: the second
+                    # size makes dynamo compile a batch-dynamic graph now rather than on
+                    # the first merged request (a fixed-shape compile would recompile per size)
+                    for batch_size in (1, MAX_BATCH_SIZE):
+                        batch = example.expand(batch_size, -1, -1, -1).contiguous(memory_format=torch.channels_last)
+                        for _ in range(warmup_iters):
+                            compiled(batch)
+                return compiled
+            except Exception as e:
+                print(f"Warning: torch.compile failed, falling back to TorchScript: {e}")
+    try:
+        with torch.no_grad():
+            traced = torch.jit.freeze(torch.jit.trace(model, example).eval())
+            if optimize:
+                traced = torch.jit.optimize_for_inference(traced)
+        # Frozen modules inline their weights, so remember the input dtype for _forward
+        traced.input_dtype = dtype
+        with torch.inference_mode():
+            # The profiling executor specializes the graph over the first few calls
+            for _ in range(warmup_iters):
+                traced(example)
+        return traced
+    except Exception as e:
+        print(f"Warning: TorchScript tracing failed, using eager model: {e}")
+        return model
+
+
+# On CUDA, ONNX Runtime's TensorRT execution provider (onnxruntime-gpu built with TensorRT)
+# is tried first; set TENSORRT=0 to stay on the plain CUDA provider
+TENSORRT = os.environ.get('TENSORRT', '1') != '0'
+# Built engines are cached here; ORT keys them by model, GPU and TensorRT version,
+# so restarts load the engine instead of rebuilding it
+TRT_ENGINE_CACHE_DIR = os.environ.get(
+    'TRT_ENGINE_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trt_cache'))
+
+
+def _tensorrt_options(input_size):
+    """TensorRT EP options: FP16 kernels, on-disk engine cache, one profile covering every batch size we run"""
+    max_batch = max(MAX_BATCH_SIZE, INFERENCE_BATCH_SIZE)
+    shape = f"3x{input_size}x{input_size}"
     return {
-        'standard': standard_transform,
-        'tiny': tiny_transform,
-        'nano': nano_transform
+        'trt_fp16_enable': True,
+        'trt_engine_cache_enable': True,
+        'trt_engine_cache_path': TRT_ENGINE_CACHE_DIR,
+        'trt_timing_cache_enable': True,
+        'trt_timing_cache_path': TRT_ENGINE_CACHE_DIR,
+        'trt_profile_min_shapes': f"input:1x{shape}",
+        'trt_profile_opt_shapes': f"input:{INFERENCE_BATCH_SIZE}x{shape}",
+        'trt_profile_max_shapes': f"input:{max_batch}x{shape}",
     }
 
 
-def predict_single_image(model, image, transform, device, class_names=['AI Art', 'Real Art']):
+class OnnxRuntimeModel:
+    """
+    Callable stand-in for a torch model that runs an exported ONNX graph through ONNX Runtime.
+    Takes an (N, 3, H, W) torch tensor on the serving device and returns logits as a CPU
+    torch tensor. On CUDA the input is bound by device pointer, so no extra host copy is made.
+    """
+    def __init__(self, onnx_bytes, device, input_dtype, input_size=None):
+        self.device = device
+        self.input_dtype = input_dtype
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # Follow torch's intra-op setting (wsgi.py pins it per worker) instead of ORT's
+        # default of one thread per core in every process
+        options.intra_op_num_threads = torch.get_num_threads()
+        if device.type == 'cuda':
+            providers = ['CUDAExecutionProvider']
+            if TENSORRT and input_size and 'TensorrtExecutionProvider' in ort.get_available_providers():
+                providers.insert(0, ('TensorrtExecutionProvider', _tensorrt_options(input_size)))
+        else:
+            providers = ['CPUExecutionProvider']
+        self.session = ort.InferenceSession(onnx_bytes, options, providers=providers)
+        # 'TensorrtExecutionProvider' if the engine built, else CUDA/CPU
+        self.provider = self.session.get_providers()[0]
+        self._input_name = self.session.get_inputs()[0].name
+        self._output_name = self.session.get_outputs()[0].name
+        self._np_dtype = np.float16 if input_dtype == torch.float16 else np.float32
+
+    def __call__(self, batch):
+        batch = batch.contiguous()
+        if self.device.type == 'cuda':
+            # ORT runs on its own stream; make sure the input has finished uploading
+            torch.cuda.current_stream(self.device).synchronize()
+            binding = self.session.io_binding()
+            binding.bind_input(self._input_name, 'cuda', self.device.index or 0, self._np_dtype,
+                               tuple(batch.shape), batch.data_ptr())
+            binding.bind_output(self._output_name, 'cpu')
+            self.session.run_with_iobinding(binding)
+            return torch.from_numpy(binding.copy_outputs_to_cpu()[0])
+        outputs = self.session.run([self._output_name], {self._input_name: batch.numpy()})
+        return torch.from_numpy(outputs[0])
+
+
+def export_to_onnx_runtime(model, input_size, device):
+    """
+    Export a loaded model to ONNX (in memory, dynamic batch axis) and wrap it in an
+    OnnxRuntimeModel. Returns None when onnxruntime is not installed, the device has
+    no matching execution provider, or the export fails.
+    """
+    if ort is None or device.type not in ('cuda', 'cpu'):
+        return None
+    if device.type == 'cuda' and 'CUDAExecutionProvider' not in ort.get_available_providers():
+        return None
+    try:
+        dtype = _model_dtype(model)
+        example = torch.zeros(1, 3, input_size, input_size, device=device, dtype=dtype)
+        buffer = io.BytesIO()
+        # Newer torch defaults to the torch.export-based exporter; the TorchScript one
+        # handles dynamic_axes and needs no extra packages
+        extra = {'dynamo': False} if 'dynamo' in inspect.signature(torch.onnx.export).parameters else {}
+        with torch.no_grad():
+            torch.onnx.export(model, (example,), buffer, input_names=['input'], output_names=['logits'],
+                              dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+                              opset_version=17, **extra)
+        if device.type == 'cuda' and TENSORRT:
+            os.makedirs(TRT_ENGINE_CACHE_DIR, exist_ok=True)
+        ort_model = OnnxRuntimeModel(buffer.getvalue(), device, dtype, input_size)
+        # Warm-up: first run allocates ORT's arenas (and builds or loads the TensorRT engine)
+        ort_model(example)
+        return ort_model
+    except Exception as e:
+        print(f"Warning: ONNX Runtime export failed, serving with PyTorch: {e}")
+        return None
+
+
+def _model_dtype(model):
+    dtype = getattr(model, 'input_dtype', None)
+    return dtype if dtype is not None else next(model.parameters()).dtype
+
+
+@functools.lru_cache(maxsize=None)
+def _autocast_dtype(device):
+    """Reduced precision worth autocasting FP32 models to on this device, or None"""
+    if device.type == 'cuda':
+        major, _ = torch.cuda.get_device_capability(device)
+        if major >= 8:
+            return torch.bfloat16  # Ampere+: same range as FP32, no overflow to inf/NaN
+        if major >= 7:
+            return torch.float16
+        return None  # Pre-Volta: no Tensor Cores, FP16 is slower than FP32
+    if device.type == 'mps':
+        is_available = getattr(torch.amp, 'is_autocast_available', None)
+        if is_available is not None and is_available('mps'):
+            return torch.float16
+    return None
+
+
+def _forward(model, batch, device):
+    """
+    Run the model in its own precision. Models hard-cast to FP16 at load time only need
+    their input cast, which skips autocast's per-op dispatch; FP32 models go through
+    autocast only where the device has fast reduced-precision math.
+    """
+    dtype = _model_dtype(model)
+    if batch.dtype != dtype:
+        batch = batch.to(dtype)
+    if device.type == 'cuda':
+        # Match the channels_last weights set in load_models so cuDNN picks NHWC kernels
+        batch = batch.contiguous(memory_format=torch.channels_last)
+    if dtype == torch.float32:
+        autocast_dtype = _autocast_dtype(device)
+        if autocast_dtype is not None:
+            with torch.autocast(device_type=device.type, dtype=autocast_dtype):
+                return model(batch)
+    return model(batch)
+
+
+def _predict_rows(model, batch, device):
+    """Softmax probabilities for a batch as an (N, num_classes) numpy array"""
+    # Models are put in eval mode once in load_models; calling eval() here would walk every module per request
+    with torch.inference_mode():
+        output = _forward(model, batch, device)
+        # Single device->host sync; argmax runs on the host copy
+        return F.softmax(output.float(), dim=1).cpu().numpy()
+
+
+def _class_scores(output):
+    """
+    FP32 softmax plus the per-row argmax, packed as (N, num_classes + 1): the class
+    probabilities followed by the predicted class, so one transfer brings back both
+    """
+    probabilities = F.softmax(output.float(), dim=1)
+    return torch.cat([probabilities, probabilities.argmax(dim=1, keepdim=True).float()], dim=1)
+
+
+class StagingBuffer:
+    """
+    Persistent input buffers for one model: a host tensor of shape (capacity, 3, H, W),
+    pinned on CUDA, and a device tensor of the same shape. Requests write their
+    preprocessed rows into host[:n] and run the model on upload(n), so the hot path
+    allocates nothing and the host->device copy is a real async DMA.
+    Hold `lock` from filling host until the outputs have been copied back.
+    """
+    def __init__(self, sample_shape, device, capacity=MAX_BATCH_SIZE, dtype=torch.float32):
+        self.capacity = capacity
+        self.host = torch.empty((capacity, *sample_shape), dtype=dtype,
+                                pin_memory=device.type == 'cuda')
+        # On CPU the model can read the host buffer directly
+        self.device_buffer = self.host if device.type == 'cpu' else torch.empty_like(self.host, device=device)
+        self.lock = threading.Lock()
+
+    def upload(self, rows):
+        """Copy host[:rows] to the device buffer and return that view"""
+        if self.device_buffer is self.host:
+            return self.host[:rows]
+        staged = self.device_buffer[:rows]
+        staged.copy_(self.host[:rows], non_blocking=True)
+        return staged
+
+
+def predict_single_image(model, image, transform, device, class_names=['AI Art', 'Real Art'], staging=None):
     try:
         if image.mode != 'RGB':
             image = image.convert('RGB')
-        image_tensor = transform(image).unsqueeze(0).to(device)
-        
-        # Use FP16 if model is in half precision
-        if next(model.parameters()).dtype == torch.float16:
-            image_tensor = image_tensor.half()
+        image_tensor = transform(image)
         
-        model.eval()
-        with torch.no_grad():
-            # Enable autocast for mixed precision on GPU
-            if device.type == 'cuda':
-                with torch.cuda.amp.autocast():
-                    output = model(image_tensor)
-            else:
-                output = model(image_tensor)
-            
-            probabilities = F.softmax(output, dim=1)[0].cpu().numpy()
-            predicted_class = torch.argmax(output, dim=1).item()
-            confidence = float(probabilities[predicted_class])
-        return {
+        if staging is not None:
+            with staging.lock:
+                staging.host[0].copy_(image_tensor)
+                probabilities = _predict_rows(model, staging.upload(1), device)[0]
+        else:
+            probabilities = _predict_rows(model, image_tensor.unsqueeze(0).to(device), device)[0]
+        return format_prediction(probabilities, class_names)
+    except Exception as e:
+        raise Exception(f"Error making prediction: {str(e)}")
+
+
+def format_prediction(probabilities, class_names=['AI Art', 'Real Art']):
+    """Build the prediction dict from one row of class probabilities (numpy array)"""
+    predicted_class = int(probabilities.argmax())
+    prob_values = probabilities.tolist()
+    return {
+        'predicted_class': predicted_class,
+        'predicted_label': class_names[predicted_class],
+        'confidence': prob_values[predicted_class],
+        'probabilities': dict(zip(class_names, prob_values))
+    }
+
+
+def format_predictions(probabilities, class_names=['AI Art', 'Real Art']):
+    """format_prediction for every row of an (N, num_classes) array, with argmax done once for the batch"""
+    predicted_classes = probabilities.argmax(axis=1).tolist()
+    return [
+        {
             'predicted_class': predicted_class,
             'predicted_label': class_names[predicted_class],
-            'confidence': confidence,
-            'probabilities': {
-                class_names[i]: float(prob) for i, prob in enumerate(probabilities)
-            }
+            'confidence': prob_values[predicted_class],
+            'probabilities': dict(zip(class_names, prob_values))
         }
-    except Exception as e:
-        raise Exception(f"Error making prediction: {str(e)}")
+        for predicted_class, prob_values in zip(predicted_classes, probabilities.tolist())
+    ]
+
+
+def content_digest(data):
+    """
+    Short BLAKE2b digest used as a prediction cache key. Accepts raw bytes or a seekable
+    stream, which is hashed in 1 MB chunks and rewound so it can still be decoded.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        hasher.update(data)
+    else:
+        for chunk in iter(lambda: data.read(1 << 20), b''):
+            hasher.update(chunk)
+        data.seek(0)
+    return hasher.digest()
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache with a TTL for prediction results, keyed by image identity
+    (content digest or URL). Entries older than ttl seconds count as misses.
+    A maxsize of 0 disables caching.
+    """
+    def __init__(self, maxsize=10000, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        if self.maxsize <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+class URLValidators:
+    """
+    Thread-safe LRU of ETag / Last-Modified validators per image URL, so URL predictions
+    cached in a PredictionCache can be revalidated with a cheap conditional GET once
+    they are older than max_age seconds instead of being trusted for the whole TTL.
+    URLs whose server sent neither header are never considered stale.
+    """
+    def __init__(self, max_age=300, maxsize=10000):
+        self.max_age = max_age
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_stale(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            return entry is not None and time.monotonic() - entry[0] > self.max_age
+
+    def conditional_headers(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+        if entry is None:
+            return None
+        _, etag, last_modified = entry
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def update(self, url, headers):
+        etag, last_modified = headers.get('ETag'), headers.get('Last-Modified')
+        with self._lock:
+            if not (etag or last_modified):
+                self._entries.pop(url, None)
+                return
+            self._entries[url] = (time.monotonic(), etag, last_modified)
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def touch(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries[url] = (time.monotonic(), *entry[1:])
+                self._entries.move_to_end(url)
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when a model's batch queue is full; the API answers 503"""
+
+
+class BatchScheduler:
+    """
+    Dynamic batching for concurrent requests.
+    Each model gets a worker thread that collects queued preprocessed tensors until
+    max_batch_size rows are waiting or timeout_ms has passed since the first one, runs
+    them as one forward pass and resolves each caller's Future with its rows of
+    softmax probabilities (numpy, shape (N, num_classes)).
+    Queues hold at most max_queue_depth requests; submitting to a full one raises
+    SchedulerOverloaded instead of letting latency grow without bound.
+    """
+    def __init__(self, device, max_batch_size=MAX_BATCH_SIZE, timeout_ms=BATCH_TIMEOUT_MS,
+                 max_queue_depth=MAX_QUEUE_DEPTH):
+        self.device = device
+        self.max_batch_size = max(1, max_batch_size)
+        self.timeout = max(0.0, timeout_ms) / 1000.0
+        self.max_queue_depth = max(0, max_queue_depth)
+        self._queues = {}
+        self._staging = {}
+        self._lock = threading.Lock()
+
+    def register(self, model, staging=None):
+        """Optionally attach a StagingBuffer the model's worker should batch into"""
+        with self._lock:
+            self._staging[id(model)] = staging
+
+    def submit(self, model, tensor):
+        """Queue one preprocessed (3, H, W) image; the Future resolves to a (num_classes,) array"""
+        future = Future()
+        self._enqueue(model, (tensor.unsqueeze(0), future, True))
+        return future
+
+    def submit_many(self, model, batch):
+        """Queue a stacked (N, 3, H, W) block; the Future resolves to an (N, num_classes) array"""
+        future = Future()
+        self._enqueue(model, (batch, future, False))
+        return future
+
+    def _enqueue(self, model, item):
+        try:
+            self._queue_for(model).put_nowait(item)
+        except queue.Full:
+            raise SchedulerOverloaded(f"Inference queue is full ({self.max_queue_depth} requests waiting)")
+
+    def _queue_for(self, model):
+        # Keyed by the model object so aliases ('tiny' and its full name) share one queue
+        key = id(model)
+        work_queue = self._queues.get(key)
+        if work_queue is None:
+            with self._lock:
+                work_queue = self._queues.get(key)
+                if work_queue is None:
+                    work_queue = queue.Queue(maxsize=self.max_queue_depth)
+                    worker = threading.Thread(target=self._worker,
+                                              args=(model, work_queue, self._staging.get(key)),
+                                              name='batch-scheduler', daemon=True)
+                    worker.start()
+                    self._queues[key] = work_queue
+        return work_queue
+
+    def _worker(self, model, work_queue, staging):
+        # A stream of its own lets this worker's copies and kernels overlap
+        # with work other request threads issue on the default stream
+        stream = torch.cuda.Stream(device=self.device) if self.device.type == 'cuda' else None
+        while True:
+            items = [work_queue.get()]
+            rows = items[0][0].shape[0]
+            deadline = time.monotonic() + self.timeout
+            while rows < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = work_queue.get(timeout=remaining) if remaining > 0 else work_queue.get_nowait()
+                except queue.Empty:
+                    break
+                items.append(item)
+                rows += item[0].shape[0]
+            if stream is not None:
+                with torch.cuda.stream(stream):
+                    self._run(model, items, staging)
+            else:
+                self._run(model, items, staging)
+
+    def _run(self, model, items, staging):
+        items = [item for item in items if item[1].set_running_or_notify_cancel()]
+        if not items:
+            return
+        try:
+            blocks = [block for block, _, _ in items]
+            rows = sum(block.shape[0] for block in blocks)
+            if any(block.device.type != 'cpu' for block in blocks):
+                # Some inputs were decoded on the GPU (nvJPEG): merge on the device, after
+                # the request threads' default-stream work that produced them
+                torch.cuda.current_stream(self.device).wait_stream(torch.cuda.default_stream(self.device))
+                batch = torch.cat([block.to(self.device, non_blocking=True) for block in blocks])
+                probabilities = self._infer(model, batch)
+            elif staging is not None and rows <= staging.capacity:
+                # Merge straight into the model's persistent buffers
+                with staging.lock:
+                    torch.cat(blocks, out=staging.host[:rows])
+                    probabilities = self._infer(model, staging.upload(rows))
+            else:
+                if len(blocks) == 1:
+                    batch = blocks[0]
+                else:
+                    # Merge into pinned memory on CUDA so the upload below stays asynchronous
+                    batch = torch.empty((rows, *blocks[0].shape[1:]), dtype=blocks[0].dtype,
+                                        pin_memory=self.device.type == 'cuda')
+                    torch.cat(blocks, out=batch)
+                probabilities = self._infer(model, batch)
+        except Exception as e:
+            for _, future, _ in items:
+                future.set_exception(e)
+            return
+        offset = 0
+        for block, future, single in items:
+            rows = block.shape[0]
+            future.set_result(probabilities[offset] if single else probabilities[offset:offset + rows])
+            offset += rows
+
+    def _infer(self, model, batch):
+        chunks = []
+        # inference_mode is thread-local, so the worker enters it itself
+        with torch.inference_mode():
+            for start in range(0, batch.shape[0], self.max_batch_size):
+                chunk = batch[start:start + self.max_batch_size].to(self.device, non_blocking=True)
+                output = _forward(model, chunk, self.device)
+                chunks.append(F.softmax(output.float(), dim=1))
+            # One device->host transfer for every request in the batch
+            return torch.cat(chunks).cpu().numpy()
+
+
+# Pinned host staging buffers for CUDA uploads, reused across requests and keyed by
+# batch shape. Only a few shapes are kept so odd video resolutions don't pin memory forever.
+_PINNED_LOCK = threading.Lock()
+_PINNED_FREE = {}
+_PINNED_MAX_SHAPES = 4
+_COPY_STREAMS = {}
+
+
+def _acquire_pinned(shape):
+    with _PINNED_LOCK:
+        free = _PINNED_FREE.get(shape)
+        if free:
+            return free.pop()
+    return torch.empty(shape, dtype=torch.uint8, pin_memory=True)
+
+
+def _release_pinned(buffer):
+    shape = tuple(buffer.shape)
+    with _PINNED_LOCK:
+        if shape not in _PINNED_FREE and len(_PINNED_FREE) >= _PINNED_MAX_SHAPES:
+            # Drop the oldest shape (dicts keep insertion order)
+            del _PINNED_FREE[next(iter(_PINNED_FREE))]
+        free = _PINNED_FREE.setdefault(shape, [])
+        if len(free) < 4:
+            free.append(buffer)
+
+
+def _copy_stream(device):
+    """Side stream for host->device uploads so copies overlap compute on the default stream"""
+    with _PINNED_LOCK:
+        stream = _COPY_STREAMS.get(device)
+        if stream is None:
+            stream = _COPY_STREAMS[device] = torch.cuda.Stream(device=device)
+    return stream
 
 
 def predict_multiple_images(model, images, transform, device, class_names=['AI Art', 'Real Art']):
     try:
-        # Batch processing for better GPU utilization
-        batch_size = 8  # Process multiple images at once
+        # Executor.map submits every image up front, so the pool keeps decoding
+        # later frames while the current sub-batch runs on the device
+        pending = PREPROCESS_POOL.map(_to_uint8_tensor, images)
+        use_streams = device.type == 'cuda'
+
+        # Two host staging buffers per call, ping-ponged across sub-batches: one is being
+        # filled while the other's async host->device copy may still be in flight.
+        # On CUDA they come from a persistent pinned pool and copy on a side stream.
+        host_buffers, copy_events = [None, None], [None, None]
+        copy_stream = _copy_stream(device) if use_streams else None
+        device_batch = None
+        scores = None
+        offset = 0
+        try:
+            with torch.inference_mode():
+                while True:
+                    raw_tensors = list(islice(pending, INFERENCE_BATCH_SIZE))
+                    if not raw_tensors:
+                        break
+                    count = len(raw_tensors)
+                    slot = (offset // INFERENCE_BATCH_SIZE) % 2
+                    same_shape = all(t.shape == raw_tensors[0].shape for t in raw_tensors)
+                    if same_shape and raw_tensors[0].device.type != 'cpu':
+                        # Frames decoded on the GPU (NVDEC) are already in device memory
+                        batch_tensor = transform(torch.stack(raw_tensors))
+                    elif same_shape:
+                        # Video frames share one size: ship uint8 pixels and resize/normalize on device
+                        shape = (INFERENCE_BATCH_SIZE, *raw_tensors[0].shape)
+                        host = host_buffers[slot]
+                        if copy_events[slot] is not None:
+                            copy_events[slot].synchronize()
+                        if host is None or host.shape != shape:
+                            if host is not None and use_streams:
+                                _release_pinned(host)
+                            host = _acquire_pinned(shape) if use_streams else torch.empty(shape, dtype=torch.uint8)
+                            host_buffers[slot] = host
+                        for i, t in enumerate(raw_tensors):
+                            host[i].copy_(t)
+                        if use_streams:
+                            with torch.cuda.stream(copy_stream):
+                                uploaded = host[:count].to(device, non_blocking=True)
+                                copy_events[slot] = torch.cuda.Event()
+                                copy_events[slot].record()
+                            torch.cuda.current_stream().wait_event(copy_events[slot])
+                            uploaded.record_stream(torch.cuda.current_stream())
+                        else:
+                            # MPS (and CUDA without streams) still needs the copy; a no-op on CPU
+                            uploaded = host[:count].to(device)
+                        batch_tensor = transform(uploaded)
+                    else:
+                        first = transform(raw_tensors[0])
+                        if device_batch is None or device_batch.shape[1:] != first.shape:
+                            device_batch = torch.empty((INFERENCE_BATCH_SIZE, *first.shape),
+                                                       dtype=first.dtype, device=device)
+                        device_batch[0].copy_(first)
+                        for i, t in enumerate(raw_tensors[1:], start=1):
+                            device_batch[i].copy_(transform(t))
+                        batch_tensor = device_batch[:count]
+
+                    output = _forward(model, batch_tensor, device)
+                    if scores is None:
+                        scores = torch.empty((len(images), output.shape[1] + 1),
+                                             dtype=torch.float32, device=device)
+                    scores[offset:offset + count] = _class_scores(output)
+                    offset += count
+
+                # One device->host transfer for all frames, argmax included
+                scores = scores[:offset].cpu().numpy()
+        finally:
+            for slot, host in enumerate(host_buffers):
+                if host is not None and use_streams:
+                    if copy_events[slot] is not None:
+                        copy_events[slot].synchronize()
+                    _release_pinned(host)
+        probabilities = scores[:, :-1]
+        predicted_classes = scores[:, -1].astype(np.intp)
+
         results = []
+        for frame_idx, (pred_class, probs) in enumerate(zip(predicted_classes, probabilities)):
+            results.append({
+                'frame_number': frame_idx,
+                'predicted_class': int(pred_class),
+                'predicted_label': class_names[pred_class],
+                'confidence': float(probs[pred_class]),
+                'probabilities': {
+                    class_names[k]: float(prob) for k, prob in enumerate(probs)
+                }
+            })
         
-        for i in range(0, len(images), batch_size):
-            batch_images = images[i:i+batch_size]
-            batch_tensors = []
-            
-            for image in batch_images:
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
-                tensor = transform(image)
-                batch_tensors.append(tensor)
-            
-            # Stack into batch
-            batch_tensor = torch.stack(batch_tensors).to(device)
-            
-            # Use FP16 if model is in half precision
-            if next(model.parameters()).dtype == torch.float16:
-                batch_tensor = batch_tensor.half()
-            
-            model.eval()
-            with torch.no_grad():
-                # Enable autocast for mixed precision on GPU
-                if device.type == 'cuda':
-                    with torch.cuda.amp.autocast():
-                        output = model(batch_tensor)
-                else:
-                    output = model(batch_tensor)
-                
-                probabilities = F.softmax(output, dim=1).cpu().numpy()
-                predicted_classes = torch.argmax(output, dim=1).cpu().numpy()
-            
-            # Parse batch results
-            for j, (pred_class, probs) in enumerate(zip(predicted_classes, probabilities)):
-                frame_idx = i + j
-                results.append({
-                    'frame_number': frame_idx,
-                    'predicted_class': int(pred_class),
-                    'predicted_label': class_names[pred_class],
-                    'confidence': float(probs[pred_class]),
-                    'probabilities': {
-                        class_names[k]: float(prob) for k, prob in enumerate(probs)
-                    }
-                })
-        
-        ai_predictions = sum(1 for r in results if r['predicted_class'] == 0)
-        real_predictions = sum(1 for r in results if r['predicted_class'] == 1)
+        # Aggregate straight from the arrays instead of re-scanning the result dicts
         total_frames = len(results)
-        overall_confidence = np.mean([r['confidence'] for r in results])
+        ai_predictions = int(np.count_nonzero(predicted_classes == 0))
+        real_predictions = int(np.count_nonzero(predicted_classes == 1))
+        overall_confidence = probabilities[np.arange(total_frames), predicted_classes].mean(dtype=np.float64)
         overall_prediction = 0 if ai_predictions > real_predictions else 1
         overall_label = class_names[overall_prediction]
         return {
@@ -229,25 +1300,60 @@ def predict_multiple_images(model, images, transform, device, class_names=['AI A
         raise Exception(f"Error making predictions on multiple images: {str(e)}")
 
 
-def save_prediction_result(result, result_type="image"):
+RESULTS_DIR = "api_results"
+
+
+def _result_path(result_type, timestamp):
+    return os.path.join(RESULTS_DIR, f"{result_type}_prediction_{timestamp}.json")
+
+
+def save_prediction_result(result, result_type="image", timestamp=None):
     try:
-        results_dir = "api_results"
-        os.makedirs(results_dir, exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{result_type}_prediction_{timestamp}.json"
-        filepath = os.path.join(results_dir, filename)
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        if timestamp is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filepath = _result_path(result_type, timestamp)
         result_with_metadata = {
             'timestamp': timestamp,
             'result_type': result_type,
             'prediction_result': result
         }
-        with open(filepath, 'w') as f:
-            json.dump(result_with_metadata, f, indent=2)
+        if orjson is not None:
+            # C encoder, written as bytes; also handles any numpy scalars/arrays in the result
+            with open(filepath, 'wb') as f:
+                f.write(orjson.dumps(result_with_metadata,
+                                     option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+        else:
+            with open(filepath, 'w') as f:
+                json.dump(result_with_metadata, f, indent=2)
         return filepath
     except Exception as e:
         raise Exception(f"Error saving prediction result: {str(e)}")
 
 
+def _save_done(future):
+    _SAVE_SLOTS.release()
+    if future.exception() is not None:
+        print(f"Warning: Could not save result to file: {future.exception()}")
+
+
+def save_prediction_result_async(result, result_type="image"):
+    """Queue save_prediction_result on SAVE_POOL; returns the path it will be written to,
+    or None when the save queue is full and the result was dropped"""
+    if not _SAVE_SLOTS.acquire(blocking=False):
+        print(f"Warning: save queue full, dropping {result_type} result")
+        return None
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    try:
+        # Shallow copy: the handler adds result_saved_to after this returns
+        future = SAVE_POOL.submit(save_prediction_result, dict(result), result_type, timestamp)
+    except Exception:
+        _SAVE_SLOTS.release()
+        raise
+    future.add_done_callback(_save_done)
+    return _result_path(result_type, timestamp)
+
+
 def format_api_response(success=True, data=None, message="", error=None):
     response = {
         'success': success,
@@ -262,21 +1368,22 @@ def format_api_response(success=True, data=None, message="", error=None):
     return response
 
 
+ALLOWED_IMAGE_EXTENSIONS = frozenset({'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'})
+ALLOWED_VIDEO_EXTENSIONS = frozenset({'mp4', 'avi', 'mov', 'mkv', 'wmv', 'flv', 'webm'})
+
+
 def validate_file_upload(file):
     if not file:
         return False, "No file provided"
     
     if file.filename == '':
         return False, "No file selected"    
-    allowed_image_extensions = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
-    allowed_video_extensions = {'mp4', 'avi', 'mov', 'mkv', 'wmv', 'flv', 'webm'}
-    
     filename = file.filename.lower()
     file_extension = filename.rsplit('.', 1)[1] if '.' in filename else ''
     
-    if file_extension in allowed_image_extensions:
+    if file_extension in ALLOWED_IMAGE_EXTENSIONS:
         return True, "image"
-    elif file_extension in allowed_video_extensions:
+    elif file_extension in ALLOWED_VIDEO_EXTENSIONS:
         return True, "video"
     else:
         return False, f"Unsupported file type: {file_extension}"
@@ -284,10 +1391,13 @@ def validate_file_upload(file):
 
 def cleanup_temp_files(*file_paths):
     for path in file_paths:
+        if not path:
+            continue
         try:
-            if path and os.path.exists(path):
-                os.unlink(path)
-        except Exception as e:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
             print(f"Warning: Could not delete temporary file {path}: {e}")
 import torch.nn as nn
 
@@ -352,6 +1462,64 @@ class TinyCNN(nn.Module):
                 nn.init.constant_(m.bias, 0)
 
 
+class TinySeparableCNN(nn.Module):
+    """
+    TinyCNN with each 3x3 conv split into a depthwise 3x3 and a pointwise 1x1 conv
+    (MobileNet-style), for ~8x fewer MACs in the feature extractor.
+    Same 64x64 input and classifier head as TinyCNN, but needs its own checkpoint.
+    """
+    def __init__(self, num_classes=2, input_size=64):
+        super(TinySeparableCNN, self).__init__()
+        
+        self.features = nn.Sequential(
+            *self._separable_block(3, 8),    # 64x64 -> 32x32
+            *self._separable_block(8, 16),   # 32x32 -> 16x16
+            *self._separable_block(16, 32),  # 16x16 -> 8x8
+            *self._separable_block(32, 64),  # 8x8 -> 4x4
+            
+            # Global pooling
+            nn.AdaptiveAvgPool2d((1, 1))  # 4x4 -> 1x1
+        )
+        
+        self.classifier = nn.Sequential(
+            nn.Dropout(0.3),
+            nn.Linear(64, 32),
+            nn.ReLU(inplace=True),
+            nn.Dropout(0.2),
+            nn.Linear(32, num_classes)
+        )
+        
+        self._initialize_weights()
+    
+    @staticmethod
+    def _separable_block(in_channels, out_channels, stride=2):
+        return [
+            nn.Conv2d(in_channels, in_channels, kernel_size=3, stride=stride, padding=1,
+                      groups=in_channels, bias=False),
+            nn.BatchNorm2d(in_channels),
+            nn.ReLU(inplace=True),
+            nn.Conv2d(in_channels, out_channels, kernel_size=1, bias=False),
+            nn.BatchNorm2d(out_channels),
+            nn.ReLU(inplace=True),
+        ]
+    
+    def forward(self, x):
+        x = self.features(x)
+        x = x.view(x.size(0), -1)
+        x = self.classifier(x)
+        return x
+    
+    def _initialize_weights(self):
+        for m in self.modules():
+            if isinstance(m, nn.Conv2d):
+                nn.init.kaiming_normal_(m.weight, mode='fan_out', nonlinearity='relu')
+            elif isinstance(m, nn.BatchNorm2d):
+                nn.init.constant_(m.weight, 1)
+                nn.init.constant_(m.bias, 0)
+            elif isinstance(m, nn.Linear):
+                nn.init.normal_(m.weight, 0, 0.01)
+                nn.init.constant_(m.bias, 0)
+
 class NanoCNN(nn.Module):
     """
     Nano CNN for lightning-fast training
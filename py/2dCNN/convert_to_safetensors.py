@@ -0,0 +1,29 @@
+"""
+One-time conversion of the *.pth state_dicts in a directory to .safetensors.
+load_models prefers the .safetensors copy when both exist: it is memory-mapped
+straight onto the serving device and, unlike a pickle, cannot run code on load.
+
+    python convert_to_safetensors.py [model_dir]
+"""
+
+import os
+import sys
+
+import torch
+from safetensors.torch import save_file
+
+
+def convert(model_dir):
+    for f in sorted(os.listdir(model_dir)):
+        if not f.endswith('.pth'):
+            continue
+        src = os.path.join(model_dir, f)
+        dst = os.path.splitext(src)[0] + '.safetensors'
+        state = torch.load(src, map_location='cpu', weights_only=True)
+        # safetensors refuses shared or non-contiguous storage
+        save_file({k: v.contiguous().clone() for k, v in state.items()}, dst)
+        print(f"Converted {src} -> {dst}")
+
+
+if __name__ == '__main__':
+    convert(sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.path.abspath(__file__)))
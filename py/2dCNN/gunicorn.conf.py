@@ -0,0 +1,34 @@
+"""
+Gunicorn settings for the Deep Fake Detection API. Gunicorn reads this file automatically
+when started from py/2dCNN:
+
+    gunicorn wsgi:app
+
+CPU hosts run one worker per core, each with a few threads for the download/decode
+stages. GPU hosts run a single worker with many threads so all requests share one CUDA
+context and the batch scheduler can merge their forward passes. Override with
+WEB_CONCURRENCY / GUNICORN_THREADS / GUNICORN_BIND.
+"""
+
+import multiprocessing
+import os
+import shutil
+
+# Don't import torch here: probing CUDA in the master would leak a context into the forks
+_gpu = shutil.which('nvidia-smi') is not None and os.environ.get('CUDA_VISIBLE_DEVICES') != ''
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', '1' if _gpu else str(multiprocessing.cpu_count())))
+threads = int(os.environ.get('GUNICORN_THREADS', '32' if _gpu else '4'))
+
+# Models are loaded in each worker (wsgi.py) rather than preloaded in the master:
+# CUDA contexts and ONNX Runtime thread pools do not survive fork, and the CNN
+# checkpoints are small enough that sharing them copy-on-write saves little
+preload_app = False
+
+# Video requests decode, download and run up to 20 frames; leave room beyond the
+# 60 s PREDICT_TIMEOUT before the arbiter kills a worker
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
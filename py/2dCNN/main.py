@@ -1,4 +1,7 @@
 import os
+import copy
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -14,10 +17,20 @@ import torch.nn as nn
 import torch.optim as optim
 import torch.nn.functional as F
 from torch.utils.data import Dataset, DataLoader
+try:
+    from torch.nn.attention import sdpa_kernel, SDPBackend
+except ImportError:  # torch < 2.3: leave backend selection to PyTorch
+    sdpa_kernel = None
 import torchvision
 import torchvision.transforms as transforms
 from torchvision import models
+from torch.ao.quantization import fuse_modules, get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
 import timm 
+try:
+    import kornia.augmentation as K
+except ImportError:  # augment per sample with PIL in the DataLoader workers instead
+    K = None
 np.random.seed(42)
 torch.manual_seed(42)
 if torch.cuda.is_available():
@@ -27,6 +40,9 @@ if torch.cuda.is_available():
     torch.backends.cudnn.benchmark = True
     torch.backends.cudnn.enabled = True
     torch.backends.cudnn.deterministic = False  # For better performance
+    # TF32 tensor cores for the FP32 convs/matmuls left outside autocast (Ampere+)
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
     
 # Device detection: MPS (Apple Silicon) > CUDA (NVIDIA) > CPU
 if torch.backends.mps.is_available():
@@ -41,9 +57,32 @@ elif torch.cuda.is_available():
 else:
     device = torch.device("cpu")
     print(f"Using device: {device}")
+
+# Mixed precision on CUDA: bfloat16 on Ampere+ (FP32's exponent range, so no loss scaling
+# and no FP16 overflow in ViT attention); float16 with a GradScaler on older GPUs
+# Ampere+ is detected by compute capability: is_bf16_supported() also reports the slow
+# emulated bf16 on Volta/Turing, which would skip the float16 + GradScaler path there
+use_amp = device.type == 'cuda'
+amp_dtype = torch.bfloat16 if use_amp and torch.cuda.get_device_capability()[0] >= 8 else torch.float16
+# torch.compile (Inductor + CUDA graphs) needs Triton, which is not available on Windows
+use_compile = device.type == 'cuda' and os.name != 'nt'
+# NHWC layout lets cuDNN's FP16/BF16 tensor-core conv kernels run without transposes
+memory_format = torch.channels_last if device.type == 'cuda' else torch.contiguous_format
 plt.style.use('default')
 sns.set_palette("husl")
 
+def load_rgb(image_path, target_size=224):
+    """
+    Open an image as RGB. JPEGs are decoded at a reduced DCT scale that still leaves at
+    least 2x target_size (same as the API's open_image), which skips most of the decode
+    work for large photos that are resized to 224x224 anyway.
+    """
+    image = Image.open(image_path)
+    image.draft('RGB', (target_size * 2, target_size * 2))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
 class ArtDataset(Dataset):
     def __init__(self, data_dir, transform=None, max_samples_per_class=None):
         self.data_dir = data_dir
@@ -51,25 +90,29 @@ class ArtDataset(Dataset):
         self.images = []
         self.labels = []        
         ai_art_dir = os.path.join(data_dir, 'AiArtData', 'AiArtData')
-        if os.path.exists(ai_art_dir):
-            ai_files = [f for f in os.listdir(ai_art_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-            if max_samples_per_class:
-                ai_files = ai_files[:max_samples_per_class]
-            for file in ai_files:
-                self.images.append(os.path.join(ai_art_dir, file))
-                self.labels.append(0)  # AI Art = 0        
         real_art_dir = os.path.join(data_dir, 'RealArt', 'RealArt')
-        if os.path.exists(real_art_dir):
-            real_files = [f for f in os.listdir(real_art_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-            if max_samples_per_class:
-                real_files = real_files[:max_samples_per_class]
-            for file in real_files:
-                self.images.append(os.path.join(real_art_dir, file))
-                self.labels.append(1)  # Real Art = 1
+        # Scan both class directories concurrently (filesystem-bound on large datasets)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            ai_files, real_files = executor.map(
+                lambda d: self._list_images(d, max_samples_per_class) if os.path.exists(d) else [],
+                [ai_art_dir, real_art_dir])
+        self.images += ai_files
+        self.labels += [0] * len(ai_files)  # AI Art = 0        
+        self.images += real_files
+        self.labels += [1] * len(real_files)  # Real Art = 1
         
+        counts = np.bincount(np.asarray(self.labels, dtype=np.int64), minlength=2)
         print(f"Loaded {len(self.images)} images total")
-        print(f"AI Art: {sum(1 for label in self.labels if label == 0)}")
-        print(f"Real Art: {sum(1 for label in self.labels if label == 1)}")
+        print(f"AI Art: {counts[0]}")
+        print(f"Real Art: {counts[1]}")
+    
+    @staticmethod
+    def _list_images(directory, limit=None):
+        """Image file paths in directory (listing order), at most limit of them"""
+        with os.scandir(directory) as entries:
+            files = [entry.path for entry in entries
+                     if entry.name.lower().endswith(('.png', '.jpg', '.jpeg'))]
+        return files[:limit] if limit else files
     
     def __len__(self):
         return len(self.images)
@@ -77,7 +120,7 @@ class ArtDataset(Dataset):
     def __getitem__(self, idx):
         try:
             image_path = self.images[idx]
-            image = Image.open(image_path).convert('RGB')
+            image = load_rgb(image_path)
             label = self.labels[idx]
             
             if self.transform:
@@ -90,14 +133,29 @@ class ArtDataset(Dataset):
                 return self.transform(Image.new('RGB', (224, 224), (0, 0, 0))), self.labels[idx]
             return Image.new('RGB', (224, 224), (0, 0, 0)), self.labels[idx]
 
-train_transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.RandomHorizontalFlip(p=0.5),
-    transforms.RandomRotation(10),
-    transforms.ColorJitter(brightness=0.2, contrast=0.2, saturation=0.2, hue=0.1),
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-])
+if K is not None and device.type == 'cuda':
+    # Workers only decode and resize; flip/rotate/jitter/normalize run batched on the GPU
+    # in train_model, with per-sample random parameters like the PIL pipeline
+    train_transform = transforms.Compose([
+        transforms.Resize((224, 224)),
+        transforms.ToTensor()
+    ])
+    gpu_augment = nn.Sequential(
+        K.RandomHorizontalFlip(p=0.5),
+        K.RandomRotation(degrees=10.0, p=1.0),
+        K.ColorJitter(brightness=0.2, contrast=0.2, saturation=0.2, hue=0.1, p=1.0),
+        K.Normalize(mean=torch.tensor([0.485, 0.456, 0.406]), std=torch.tensor([0.229, 0.224, 0.225]))
+    ).to(device)
+else:
+    train_transform = transforms.Compose([
+        transforms.Resize((224, 224)),
+        transforms.RandomHorizontalFlip(p=0.5),
+        transforms.RandomRotation(10),
+        transforms.ColorJitter(brightness=0.2, contrast=0.2, saturation=0.2, hue=0.1),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+    ])
+    gpu_augment = None
 
 val_transform = transforms.Compose([
     transforms.Resize((224, 224)),
@@ -107,23 +165,62 @@ val_transform = transforms.Compose([
 data_dir = './data'
 full_dataset = ArtDataset(data_dir, transform=None, max_samples_per_class=1000)  # Limit for faster training
 train_idx, val_idx = train_test_split(
-    range(len(full_dataset)), 
+    np.arange(len(full_dataset)), 
     test_size=0.2, 
-    stratify=full_dataset.labels, 
+    stratify=np.asarray(full_dataset.labels), 
     random_state=42
 )
+def precompute_tensors(dataset, cache_dir, size=224):
+    """
+    Decode and resize every image in the dataset once into a uint8 (N, size, size, 3) .npy
+    file that SubsetDataset memory-maps, so later epochs skip the JPEG decode entirely.
+    The file name hashes every image's path, size and mtime, so a changed dataset (including
+    an image edited or replaced under the same name) gets a fresh cache.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for image_path in dataset.images:
+        st = os.stat(image_path)
+        digest.update(f'{image_path}\t{st.st_size}\t{st.st_mtime_ns}\n'.encode())
+    key = digest.hexdigest()
+    path = os.path.join(cache_dir, f'images_{size}_{key}.npy')
+    if os.path.exists(path):
+        print(f"Using cached images: {path}")
+        return path
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = path + '.tmp'
+    array = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8,
+                                      shape=(len(dataset.images), size, size, 3))
+    for i, image_path in enumerate(dataset.images):
+        try:
+            array[i] = np.asarray(load_rgb(image_path, size).resize((size, size), Image.BILINEAR))
+        except Exception as e:
+            print(f"Error loading image {image_path}: {e}")
+            array[i] = 0
+    array.flush()
+    del array
+    os.replace(tmp_path, path)
+    print(f"Cached {len(dataset.images)} images to {path}")
+    return path
+
 class SubsetDataset(Dataset):
-    def __init__(self, dataset, indices, transform=None):
+    def __init__(self, dataset, indices, transform=None, cache_path=None):
         self.dataset = dataset
         self.indices = indices
         self.transform = transform
+        self.cache_path = cache_path
+        # Opened lazily so each DataLoader worker maps the file itself instead of pickling it
+        self._cache = None
     
     def __len__(self):
         return len(self.indices)
     
     def __getitem__(self, idx):
-        image_path = self.dataset.images[self.indices[idx]]
-        image = Image.open(image_path).convert('RGB')
+        if self.cache_path is not None:
+            if self._cache is None:
+                self._cache = np.load(self.cache_path, mmap_mode='r')
+            image = Image.fromarray(np.array(self._cache[self.indices[idx]]))
+        else:
+            image = load_rgb(self.dataset.images[self.indices[idx]])
         label = self.dataset.labels[self.indices[idx]]
         
         if self.transform:
@@ -131,14 +228,19 @@ class SubsetDataset(Dataset):
         
         return image, label
 
-train_dataset = SubsetDataset(full_dataset, train_idx, train_transform)
-val_dataset = SubsetDataset(full_dataset, val_idx, val_transform)
+cache_path = precompute_tensors(full_dataset, os.path.join(data_dir, '.cache'))
+train_dataset = SubsetDataset(full_dataset, train_idx, train_transform, cache_path)
+val_dataset = SubsetDataset(full_dataset, val_idx, val_transform, cache_path)
 batch_size = 32
 
 # Optimize DataLoader for GPU: use pin_memory and adjust num_workers
 # On Windows, num_workers > 0 can cause issues, use 0 for compatibility
 num_workers = 0 if os.name == 'nt' else 4  # Windows uses 0, others use 4
 pin_memory = torch.cuda.is_available()  # Enable pinned memory for faster GPU transfer
+# Keep workers alive across epochs instead of re-forking them; each prefetches a few batches
+# ahead (kept modest since every prefetched batch is held in host memory)
+persistent_workers = num_workers > 0
+prefetch_factor = 4 if num_workers > 0 else None
 
 train_loader = DataLoader(
     train_dataset, 
@@ -146,7 +248,9 @@ train_loader = DataLoader(
     shuffle=True, 
     num_workers=num_workers,
     pin_memory=pin_memory,
-    persistent_workers=False  # Disable on Windows
+    persistent_workers=persistent_workers,
+    prefetch_factor=prefetch_factor,
+    drop_last=use_compile  # Keep every training batch the same shape for the compiled graphs
 )
 val_loader = DataLoader(
     val_dataset, 
@@ -154,7 +258,8 @@ val_loader = DataLoader(
     shuffle=False, 
     num_workers=num_workers,
     pin_memory=pin_memory,
-    persistent_workers=False
+    persistent_workers=persistent_workers,
+    prefetch_factor=prefetch_factor
 )
 
 print(f"Training samples: {len(train_dataset)}")
@@ -165,8 +270,10 @@ class CNNArtDetector(nn.Module):
     def __init__(self, num_classes=2, dropout_rate=0.5):
         super(CNNArtDetector, self).__init__()        
         self.backbone = models.resnet50(pretrained=True)        
-        for param in list(self.backbone.parameters())[:-20]:
-            param.requires_grad = False        
+        # Fine-tune only the last two layer4 bottlenecks and the new head; forward() runs
+        # everything before them without autograd
+        self.backbone.requires_grad_(False)
+        self.backbone.layer4[1:].requires_grad_(True)
         num_features = self.backbone.fc.in_features        
         self.backbone.fc = nn.Sequential(
             nn.Dropout(dropout_rate),
@@ -180,7 +287,32 @@ class CNNArtDetector(nn.Module):
         )
     
     def forward(self, x):
-        return self.backbone(x)
+        b = self.backbone
+        # Frozen stages: no graph is built, so their activations aren't kept for backward
+        with torch.no_grad():
+            x = b.maxpool(b.relu(b.bn1(b.conv1(x))))
+            x = b.layer3(b.layer2(b.layer1(x)))
+            x = b.layer4[0](x)
+        for block in b.layer4[1:]:
+            x = block(x)
+        x = torch.flatten(b.avgpool(x), 1)
+        return b.fc(x)
+    
+    def fuse(self):
+        """
+        Fold every BatchNorm of the ResNet backbone into the preceding conv (inference only:
+        call eval() first; the fused model can no longer be trained or loaded from the
+        unfused state_dict). The Bottleneck ReLU is shared between three convs, so only
+        the stem's conv-bn-relu is fused all the way.
+        """
+        groups = [['conv1', 'bn1', 'relu']]
+        for name, block in self.backbone.named_modules():
+            if isinstance(block, models.resnet.Bottleneck):
+                groups += [[f'{name}.conv{i}', f'{name}.bn{i}'] for i in (1, 2, 3)]
+                if block.downsample is not None:
+                    groups.append([f'{name}.downsample.0', f'{name}.downsample.1'])
+        fuse_modules(self.backbone, groups, inplace=True)
+        return self
 
 class CustomCNN(nn.Module):
     def __init__(self, num_classes=2):
@@ -221,8 +353,23 @@ class CustomCNN(nn.Module):
         x = self.dropout(x)
         x = self.fc3(x)     
         return x
+    
+    def fuse(self):
+        """Fold bn1-bn4 into conv1-conv4 for inference (call eval() first)"""
+        fuse_modules(self, [[f'conv{i}', f'bn{i}'] for i in (1, 2, 3, 4)], inplace=True)
+        return self
+
+def compile_model(model):
+    """
+    Compile in place with mode='reduce-overhead' (Inductor kernel fusion + CUDA graphs).
+    Compiling the module itself rather than wrapping it keeps state_dict keys unchanged,
+    so the saved checkpoints still load into the plain model classes.
+    """
+    if use_compile:
+        model.compile(mode='reduce-overhead')
+    return model
 
-cnn_model = CNNArtDetector(num_classes=2).to(device)
+cnn_model = compile_model(CNNArtDetector(num_classes=2).to(device, memory_format=memory_format))
 print(f"CNN Model parameters: {sum(p.numel() for p in cnn_model.parameters()):,}")
 print(f"Trainable parameters: {sum(p.numel() for p in cnn_model.parameters() if p.requires_grad):,}")
 
@@ -262,7 +409,8 @@ class CustomViT(nn.Module):
         self.patch_size = patch_size
         self.num_patches = (img_size // patch_size) ** 2
         self.patch_dim = 3 * patch_size ** 2        
-        self.patch_embedding = nn.Linear(self.patch_dim, dim)        
+        # Strided conv = per-patch linear projection, without materializing the unfolded patches
+        self.patch_embedding = nn.Conv2d(3, dim, kernel_size=patch_size, stride=patch_size)        
         self.pos_embedding = nn.Parameter(torch.randn(1, self.num_patches + 1, dim))        
         self.cls_token = nn.Parameter(torch.randn(1, 1, dim))        
         encoder_layer = nn.TransformerEncoderLayer(
@@ -271,9 +419,11 @@ class CustomViT(nn.Module):
             dim_feedforward=mlp_dim,
             dropout=0.1,
             activation='gelu',
-            batch_first=True
+            batch_first=True,
+            norm_first=True  # Pre-LN, as in the original ViT
         )
-        self.transformer = nn.TransformerEncoder(encoder_layer, num_layers=depth)        
+        self.transformer = nn.TransformerEncoder(encoder_layer, num_layers=depth,
+                                                 enable_nested_tensor=False)        
         self.classifier = nn.Sequential(
             nn.LayerNorm(dim),
             nn.Linear(dim, num_classes)
@@ -281,38 +431,43 @@ class CustomViT(nn.Module):
     
     def forward(self, x):
         batch_size = x.shape[0]        
-        x = x.unfold(2, self.patch_size, self.patch_size).unfold(3, self.patch_size, self.patch_size)
-        x = x.contiguous().view(batch_size, -1, self.patch_dim)
-        x = self.patch_embedding(x)        
+        x = self.patch_embedding(x).flatten(2).transpose(1, 2)  # (B, num_patches, dim)
         cls_tokens = self.cls_token.expand(batch_size, -1, -1)
         x = torch.cat([cls_tokens, x], dim=1)
         x += self.pos_embedding    
-        x = self.transformer(x)     
+        if sdpa_kernel is not None and x.is_cuda:
+            # Only the fused FlashAttention / memory-efficient kernels, never the math
+            # fallback that materializes the full (tokens x tokens) attention matrix
+            with sdpa_kernel([SDPBackend.FLASH_ATTENTION, SDPBackend.EFFICIENT_ATTENTION]):
+                x = self.transformer(x)
+        else:
+            x = self.transformer(x)     
         cls_output = x[:, 0]
         output = self.classifier(cls_output)
         
         return output
 
 try:
-    vit_model = ViTArtDetector(model_name='vit_base_patch16_224', num_classes=2).to(device)
+    vit_model = compile_model(ViTArtDetector(model_name='vit_base_patch16_224', num_classes=2).to(device))
     print(f"ViT Model parameters: {sum(p.numel() for p in vit_model.parameters()):,}")
     print(f"Trainable parameters: {sum(p.numel() for p in vit_model.parameters() if p.requires_grad):,}")
 except Exception as e:
     print(f"Error loading pre-trained ViT: {e}")
     print("Using custom ViT implementation...")
-    vit_model = CustomViT(num_classes=2).to(device)
+    vit_model = compile_model(CustomViT(num_classes=2).to(device))
     print(f"Custom ViT Model parameters: {sum(p.numel() for p in vit_model.parameters()):,}")
 
-def train_model(model, train_loader, val_loader, num_epochs=10, learning_rate=1e-4):
+def train_model(model, train_loader, val_loader, num_epochs=10, learning_rate=1e-4, augment=None):
     """
-    Train the model with GPU optimization
+    Train the model with GPU optimization. augment, if given, is applied to each
+    training batch after it reaches the device.
     """
     criterion = nn.CrossEntropyLoss()
     optimizer = optim.AdamW(model.parameters(), lr=learning_rate, weight_decay=1e-4)
     scheduler = optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=num_epochs)
     
-    # Enable mixed precision training for faster GPU performance
-    scaler = torch.cuda.amp.GradScaler() if torch.cuda.is_available() else None
+    # Loss scaling is only needed for float16; disabled, the scaler passes calls straight through
+    scaler = torch.amp.GradScaler('cuda', enabled=use_amp and amp_dtype == torch.float16)
     
     train_losses = []
     train_accuracies = []
@@ -324,64 +479,59 @@ def train_model(model, train_loader, val_loader, num_epochs=10, learning_rate=1e
     
     for epoch in range(num_epochs):
         model.train()
-        train_loss = 0.0
-        train_correct = 0
+        # Accumulated on the device and read once per epoch, so batches don't sync with the host
+        train_loss = torch.zeros((), device=device)
+        train_correct = torch.zeros((), dtype=torch.long, device=device)
         train_total = 0
         
         for batch_idx, (data, target) in enumerate(train_loader):
             data, target = data.to(device, non_blocking=True), target.to(device, non_blocking=True)
+            if augment is not None:
+                data = augment(data)
+            data = data.contiguous(memory_format=memory_format)
             
             optimizer.zero_grad(set_to_none=True)  # More efficient than zero_grad()
             
-            # Use automatic mixed precision on GPU
-            if torch.cuda.is_available():
-                with torch.cuda.amp.autocast():
-                    output = model(data)
-                    loss = criterion(output, target)
-                scaler.scale(loss).backward()
-                scaler.step(optimizer)
-                scaler.update()
-            else:
+            # Forward and loss in mixed precision; the optimizer keeps FP32 master weights
+            with torch.autocast(device_type=device.type, dtype=amp_dtype, enabled=use_amp):
                 output = model(data)
                 loss = criterion(output, target)
-                loss.backward()
-                optimizer.step()
+            scaler.scale(loss).backward()
+            scaler.step(optimizer)
+            scaler.update()
             
-            train_loss += loss.item()
+            train_loss += loss.detach().float()
             _, predicted = torch.max(output.data, 1)
             train_total += target.size(0)
-            train_correct += (predicted == target).sum().item()
+            train_correct += (predicted == target).sum()
             
             if batch_idx % 10 == 0:
                 print(f'Epoch {epoch+1}/{num_epochs}, Batch {batch_idx}/{len(train_loader)}, Loss: {loss.item():.4f}')
         
         model.eval()
-        val_loss = 0.0
-        val_correct = 0
+        val_loss = torch.zeros((), device=device)
+        val_correct = torch.zeros((), dtype=torch.long, device=device)
         val_total = 0
         
         with torch.no_grad():
             for data, target in val_loader:
                 data, target = data.to(device, non_blocking=True), target.to(device, non_blocking=True)
+                data = data.contiguous(memory_format=memory_format)
                 
                 # Use mixed precision for validation too
-                if torch.cuda.is_available():
-                    with torch.cuda.amp.autocast():
-                        output = model(data)
-                        loss = criterion(output, target)
-                else:
+                with torch.autocast(device_type=device.type, dtype=amp_dtype, enabled=use_amp):
                     output = model(data)
                     loss = criterion(output, target)
                 
-                val_loss += loss.item()
+                val_loss += loss.float()
                 _, predicted = torch.max(output.data, 1)
                 val_total += target.size(0)
-                val_correct += (predicted == target).sum().item()
+                val_correct += (predicted == target).sum()
         
-        train_acc = 100 * train_correct / train_total
-        val_acc = 100 * val_correct / val_total
-        avg_train_loss = train_loss / len(train_loader)
-        avg_val_loss = val_loss / len(val_loader)
+        train_acc = 100 * train_correct.item() / train_total
+        val_acc = 100 * val_correct.item() / val_total
+        avg_train_loss = train_loss.item() / len(train_loader)
+        avg_val_loss = val_loss.item() / len(val_loader)
         
         train_losses.append(avg_train_loss)
         train_accuracies.append(train_acc)
@@ -390,7 +540,8 @@ def train_model(model, train_loader, val_loader, num_epochs=10, learning_rate=1e
         
         if val_acc > best_val_acc:
             best_val_acc = val_acc
-            best_model_state = model.state_dict().copy()
+            # Snapshot on the host: a dict copy would alias the live weights, and a GPU clone costs VRAM
+            best_model_state = {k: v.detach().to('cpu', copy=True) for k, v in model.state_dict().items()}
         
         scheduler.step()
         
@@ -418,10 +569,12 @@ def evaluate_model(model, test_loader):
     all_predictions = []
     all_targets = []
     
-    with torch.no_grad():
+    with torch.inference_mode():
         for data, target in test_loader:
-            data, target = data.to(device), target.to(device)
-            output = model(data)
+            data, target = data.to(device, non_blocking=True), target.to(device, non_blocking=True)
+            data = data.contiguous(memory_format=memory_format)
+            with torch.autocast(device_type=device.type, dtype=amp_dtype, enabled=use_amp):
+                output = model(data)
             _, predicted = torch.max(output, 1)
             
             all_predictions.extend(predicted.cpu().numpy())
@@ -435,6 +588,24 @@ def evaluate_model(model, test_loader):
     
     return accuracy, report, cm, all_predictions, all_targets
 
+def quantize_int8(model, calibration_loader, num_batches=8):
+    """
+    Static post-training INT8 quantization (FX graph mode, x86 config for VNNI) of a CPU
+    copy of the trained model, calibrated on a few batches. Returns a frozen TorchScript
+    module, so it can be saved and loaded without the model class.
+    """
+    float_model = copy.deepcopy(model).cpu().eval()
+    example = next(iter(calibration_loader))[0][:1]
+    prepared = prepare_fx(float_model, get_default_qconfig_mapping('x86'), (example,))
+    with torch.inference_mode():
+        for batch_idx, (data, _) in enumerate(calibration_loader):
+            if batch_idx >= num_batches:
+                break
+            prepared(data)
+    quantized = convert_fx(prepared)
+    with torch.no_grad():
+        return torch.jit.freeze(torch.jit.trace(quantized, example).eval())
+
 def plot_training_history(history, model_name):
     """
     Plot training and validation metrics
@@ -485,7 +656,7 @@ num_epochs = 15
 learning_rate = 1e-4
 
 cnn_history = train_model(cnn_model, train_loader, val_loader, 
-                         num_epochs=num_epochs, learning_rate=learning_rate)
+                         num_epochs=num_epochs, learning_rate=learning_rate, augment=gpu_augment)
 
 plot_training_history(cnn_history, "CNN (ResNet50)")
 
@@ -497,10 +668,23 @@ num_epochs_vit = 12
 learning_rate_vit = 5e-5 
 
 vit_history = train_model(vit_model, train_loader, val_loader, 
-                         num_epochs=num_epochs_vit, learning_rate=learning_rate_vit)
+                         num_epochs=num_epochs_vit, learning_rate=learning_rate_vit, augment=gpu_augment)
 
 plot_training_history(vit_history, "Vision Transformer")
 
+# Save before fusing: fused models have a different state_dict
+torch.save(cnn_model.state_dict(), 'cnn_art_detector.pth')
+torch.save(vit_model.state_dict(), 'vit_art_detector.pth')
+print("\nModels saved successfully!")
+
+# INT8 copy of the CNN (~4x smaller), used for the sample predictions below on CPU
+cnn_int8_model = quantize_int8(cnn_model, val_loader)
+torch.jit.save(cnn_int8_model, 'cnn_art_detector_int8.pt')
+print("INT8 CNN saved to cnn_art_detector_int8.pt")
+
+# Training is done: fold BatchNorm into the convs for evaluation and prediction
+cnn_model.eval().fuse()
+
 print("=" * 60)
 print("EVALUATING CNN MODEL")
 print("=" * 60)
@@ -562,9 +746,6 @@ for i, v in enumerate(f1_scores):
 
 plt.tight_layout()
 plt.show()
-torch.save(cnn_model.state_dict(), 'cnn_art_detector.pth')
-torch.save(vit_model.state_dict(), 'vit_art_detector.pth')
-print("\nModels saved successfully!")
 print("\n" + "=" * 60)
 print("SUMMARY")
 print("=" * 60)
@@ -579,49 +760,82 @@ if cnn_accuracy > vit_accuracy:
 else:
     print(f"\n🏆 ViT Model performs better by {(vit_accuracy - cnn_accuracy):.4f}")
 
-def predict_image(image_path, model, transform, model_name):
+def make_predictor(model, example):
     """
-    Predict whether an image is AI-generated or real
+    Return fn(batch) -> softmax probabilities for batches shaped like example. On CUDA the
+    forward + softmax is captured once as a CUDA graph and each call just copies the input
+    in and replays it. Compiled models (mode='reduce-overhead') already replay CUDA graphs
+    internally, and CPU has no launch overhead to remove, so those run eagerly.
     """
-    try:
-        image = Image.open(image_path).convert('RGB')
-        image_tensor = transform(image).unsqueeze(0).to(device)        
-        model.eval()
-        with torch.no_grad():
-            output = model(image_tensor)
-            probabilities = F.softmax(output, dim=1)
-            predicted_class = torch.argmax(output, dim=1).item()
-            confidence = probabilities[0][predicted_class].item()
-        
-        class_names = ['AI Art', 'Real Art']
-        prediction = class_names[predicted_class]
-        fig, axes = plt.subplots(1, 2, figsize=(12, 5))        
-        axes[0].imshow(image)
-        axes[0].set_title(f'Input Image')
-        axes[0].axis('off')
-        
-        # Show prediction
-        colors = ['red' if i == predicted_class else 'gray' for i in range(2)]
-        probs = probabilities[0].cpu().numpy()
-        bars = axes[1].bar(class_names, probs, color=colors)
-        axes[1].set_title(f'{model_name} Prediction')
-        axes[1].set_ylabel('Probability')
-        axes[1].set_ylim(0, 1)        
-        for bar, prob in zip(bars, probs):
-            axes[1].text(bar.get_x() + bar.get_width()/2, bar.get_height() + 0.01, 
-                        f'{prob:.3f}', ha='center', va='bottom')
-        
-        plt.tight_layout()
-        plt.show()
-        
-        print(f"{model_name} Prediction: {prediction} (Confidence: {confidence:.3f})")
-        print(f"Probabilities - AI Art: {probs[0]:.3f}, Real Art: {probs[1]:.3f}")
-        
-        return prediction, confidence, probs
-        
-    except Exception as e:
-        print(f"Error processing image: {e}")
-        return None, None, None
+    model.eval()
+    
+    def forward(batch):
+        with torch.inference_mode():
+            return F.softmax(model(batch), dim=1)
+    
+    if device.type != 'cuda' or use_compile:
+        return forward
+    static_input = example.clone()
+    # Warm up on a side stream (cuDNN autotuning, allocator) before capturing
+    side_stream = torch.cuda.Stream()
+    side_stream.wait_stream(torch.cuda.current_stream())
+    with torch.cuda.stream(side_stream):
+        for _ in range(3):
+            forward(static_input)
+    torch.cuda.current_stream().wait_stream(side_stream)
+    graph = torch.cuda.CUDAGraph()
+    with torch.cuda.graph(graph):
+        static_output = forward(static_input)
+    
+    def replay(batch):
+        static_input.copy_(batch)
+        graph.replay()
+        return static_output.clone()
+    return replay
+
+# One predictor per (model, input shape), built on first use
+predictors = {}
+
+def predict_batch(images, model, transform):
+    """Softmax probabilities (numpy, (N, 2)) for a list of PIL images in one forward pass"""
+    batch = torch.stack([transform(image) for image in images]).to(device).contiguous(memory_format=memory_format)
+    key = (id(model), tuple(batch.shape))
+    predict = predictors.get(key)
+    if predict is None:
+        predict = predictors[key] = make_predictor(model, batch)
+    return predict(batch).float().cpu().numpy()
+
+def show_prediction(image, probs, model_name):
+    """
+    Plot and print one image's prediction from its class probabilities
+    """
+    predicted_class = int(probs.argmax())
+    confidence = float(probs[predicted_class])
+    
+    class_names = ['AI Art', 'Real Art']
+    prediction = class_names[predicted_class]
+    fig, axes = plt.subplots(1, 2, figsize=(12, 5))        
+    axes[0].imshow(image)
+    axes[0].set_title(f'Input Image')
+    axes[0].axis('off')
+    
+    # Show prediction
+    colors = ['red' if i == predicted_class else 'gray' for i in range(2)]
+    bars = axes[1].bar(class_names, probs, color=colors)
+    axes[1].set_title(f'{model_name} Prediction')
+    axes[1].set_ylabel('Probability')
+    axes[1].set_ylim(0, 1)        
+    for bar, prob in zip(bars, probs):
+        axes[1].text(bar.get_x() + bar.get_width()/2, bar.get_height() + 0.01, 
+                    f'{prob:.3f}', ha='center', va='bottom')
+    
+    plt.tight_layout()
+    plt.show()
+    
+    print(f"{model_name} Prediction: {prediction} (Confidence: {confidence:.3f})")
+    print(f"Probabilities - AI Art: {probs[0]:.3f}, Real Art: {probs[1]:.3f}")
+    
+    return prediction, confidence, probs
 
 sample_images = []
 ai_art_dir = './data/AiArtData/AiArtData'
@@ -635,16 +849,32 @@ if os.path.exists(real_art_dir):
     real_files = [f for f in os.listdir(real_art_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg'))][:2]
     sample_images.extend([os.path.join(real_art_dir, f) for f in real_files])
 
-for i, image_path in enumerate(sample_images[:4]):
+# Decode the samples once and run each model over all of them in a single batch
+sample_paths, sample_pil = [], []
+for image_path in sample_images[:4]:
+    try:
+        sample_pil.append(load_rgb(image_path))
+        sample_paths.append(image_path)
+    except Exception as e:
+        print(f"Error processing image {image_path}: {e}")
+
+if sample_pil:
+    if device.type == 'cpu':
+        cnn_name, cnn_sample_probs = "CNN (INT8)", predict_batch(sample_pil, cnn_int8_model, val_transform)
+    else:
+        cnn_name, cnn_sample_probs = "CNN", predict_batch(sample_pil, cnn_model, val_transform)
+    vit_sample_probs = predict_batch(sample_pil, vit_model, val_transform)
+
+for i, image_path in enumerate(sample_paths):
     print(f"\n{'='*60}")
     print(f"TESTING IMAGE {i+1}: {os.path.basename(image_path)}")
     print(f"{'='*60}")
     
     print("CNN Model Prediction:")
-    cnn_pred, cnn_conf, cnn_probs = predict_image(image_path, cnn_model, val_transform, "CNN")
+    cnn_pred, cnn_conf, cnn_probs = show_prediction(sample_pil[i], cnn_sample_probs[i], cnn_name)
     
     print("\nViT Model Prediction:")
-    vit_pred, vit_conf, vit_probs = predict_image(image_path, vit_model, val_transform, "ViT")
+    vit_pred, vit_conf, vit_probs = show_prediction(sample_pil[i], vit_sample_probs[i], "ViT")
     
     if cnn_pred == vit_pred:
         print(f"\n✅ Both models agree: {cnn_pred}")
@@ -2,6 +2,8 @@
 Quick GPU verification script for 2D CNN implementation
 Run this to verify GPU acceleration is working
 """
+import os
+import statistics
 import torch
 import time
 import sys
@@ -64,48 +66,85 @@ def benchmark_inference(use_gpu=True):
     model = TinyCNN(num_classes=2).to(device)
     model.eval()
     
-    # Enable FP16 on CUDA GPU (MPS doesn't support .half() well)
-    is_cuda = use_gpu and torch.cuda.is_available()
+    # Enable FP16 on CUDA GPU (MPS doesn't support .half() well, so it gets FP16 via autocast)
+    is_cuda = device.type == 'cuda'
+    use_autocast = device.type == 'mps'
     if is_cuda:
         model = model.half()
         print("Model Precision: FP16")
+    elif use_autocast:
+        print("Model Precision: FP16 (autocast)")
     else:
         print("Model Precision: FP32")
     
-    # Create dummy input (batch of 8 images, 64x64)
+    # Compile on CUDA: Inductor fuses conv+bias+ReLU and reduce-overhead replays the whole
+    # forward as a CUDA graph, which is what dominates for a model as small as TinyCNN
+    compiled = is_cuda and os.name != 'nt'
+    if compiled:
+        model.compile(mode='reduce-overhead', fullgraph=True)
+        print("Compiled: torch.compile(mode='reduce-overhead')")
+    
+    # Create dummy input (batch of 8 images, 64x64) directly on the device
     batch_size = 8
-    dummy_input = torch.randn(batch_size, 3, 64, 64).to(device)
-    if is_cuda:
-        dummy_input = dummy_input.half()
+    dummy_input = torch.randn(batch_size, 3, 64, 64, device=device,
+                              dtype=torch.float16 if is_cuda else torch.float32)
     
-    # Warm up
-    with torch.no_grad():
-        for _ in range(5):
+    # Warm up (the extra iterations cover compilation and CUDA graph recording)
+    with torch.inference_mode(), torch.autocast(device.type, dtype=torch.float16, enabled=use_autocast):
+        for _ in range(15):
             _ = model(dummy_input)
     
-    # Benchmark
+    # Without torch.compile, capture the forward as a CUDA graph so each timed iteration is
+    # a single graph launch instead of one launch per kernel (compiled models already
+    # replay CUDA graphs internally)
+    forward = lambda: model(dummy_input)
+    if is_cuda and not compiled:
+        side_stream = torch.cuda.Stream()
+        side_stream.wait_stream(torch.cuda.current_stream())
+        with torch.inference_mode(), torch.cuda.stream(side_stream):
+            for _ in range(3):
+                _ = model(dummy_input)
+        torch.cuda.current_stream().wait_stream(side_stream)
+        graph = torch.cuda.CUDAGraph()
+        with torch.inference_mode(), torch.cuda.graph(graph):
+            _ = model(dummy_input)
+        forward = graph.replay
+        print("CUDA Graph: captured")
+    
+    # Benchmark. On CUDA, time each batch with a pair of events recorded on the stream so
+    # the measurement covers the kernels themselves rather than Python launch overhead
+    # (the model is already FP16 there; MPS uses autocast)
     num_iterations = 100
-    start_time = time.time()
+    latencies = []  # ms per batch
     
-    with torch.no_grad():
+    with torch.inference_mode(), torch.autocast(device.type, dtype=torch.float16, enabled=use_autocast):
         if is_cuda:
-            with torch.cuda.amp.autocast():
-                for _ in range(num_iterations):
-                    _ = model(dummy_input)
+            events = [(torch.cuda.Event(enable_timing=True), torch.cuda.Event(enable_timing=True))
+                      for _ in range(num_iterations)]
+            for start_event, end_event in events:
+                start_event.record()
+                _ = forward()
+                end_event.record()
+            torch.cuda.synchronize()  # Wait for GPU operations to complete
+            latencies = [start_event.elapsed_time(end_event) for start_event, end_event in events]
+            elapsed_time = events[0][0].elapsed_time(events[-1][1]) / 1000  # ms -> s
         else:
+            start_time = time.perf_counter()
             for _ in range(num_iterations):
+                iter_start = time.perf_counter()
                 _ = model(dummy_input)
+                if device.type == 'mps':
+                    torch.mps.synchronize()  # MPS runs asynchronously; wait for this batch
+                latencies.append((time.perf_counter() - iter_start) * 1000)
+            elapsed_time = time.perf_counter() - start_time
     
-    if is_cuda:
-        torch.cuda.synchronize()  # Wait for GPU operations to complete
-    
-    end_time = time.time()
-    elapsed_time = end_time - start_time
     avg_time = elapsed_time / num_iterations * 1000  # Convert to ms
     throughput = (num_iterations * batch_size) / elapsed_time
     
     print(f"Total Time: {elapsed_time:.4f} seconds")
     print(f"Average Time per Batch: {avg_time:.2f} ms")
+    percentiles = statistics.quantiles(latencies, n=100)
+    print(f"Latency p50 / p99: {percentiles[49]:.2f} / {percentiles[98]:.2f} ms")
     print(f"Throughput: {throughput:.2f} images/second")
     
     return avg_time, throughput
@@ -0,0 +1,26 @@
+"""
+WSGI entry point for serving the Deep Fake Detection API with a production server:
+
+    gunicorn wsgi:app
+
+Worker/thread counts come from gunicorn.conf.py. On GPU hosts one worker process keeps
+a single copy of every model (and its GPU memory); the request threads share it and the
+batch scheduler merges their forward passes.
+"""
+
+import os
+
+# Many request threads each running multi-threaded CPU ops oversubscribe the cores;
+# keep intra-op parallelism at 1 unless explicitly configured
+os.environ.setdefault('OMP_NUM_THREADS', '1')
+
+import torch
+
+torch.set_num_threads(int(os.environ['OMP_NUM_THREADS']))
+
+from api import app, load_models, models
+
+os.makedirs('api_results', exist_ok=True)
+load_models()
+if not models:
+    print("WARNING: No models loaded! Predictions will fail until models are available.")
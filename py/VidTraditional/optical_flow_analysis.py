@@ -40,8 +40,8 @@ output_dir/
 ├── flow_magnitude_plot.png        # Flow magnitude distribution over time
 ├── flow_anomaly_heatmap.png       # Heatmap of flow anomalies
 ├── flow_frames/                   # Individual flow visualizations
-│   ├── flow_0001.png
-│   ├── flow_0010.png
+│   ├── flow_0001.jpg
+│   ├── flow_0010.jpg
 │   └── ...
 └── optical_flow_results.json      # Detection results
 
@@ -66,19 +66,358 @@ PARAMETERS:
 - anomaly_sensitivity: Sensitivity for anomaly detection (default: 2.5 std)
 """
 
+import os
+import atexit
 import cv2
 import numpy as np
 import json
+import multiprocessing
+import queue
 import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import List, Dict, Tuple
 import matplotlib.pyplot as plt
 from matplotlib import patches
 
+try:
+    import torch
+    import torch.nn.functional as F
+except ImportError:  # RAFT backend unavailable; Farneback only
+    torch = None
+
+try:
+    from numba import njit, prange, set_num_threads
+except ImportError:  # calculate_flow_smoothness uses cv2.Sobel instead
+    njit = None
+
+try:
+    import decord
+except ImportError:  # frames are decoded with cv2.VideoCapture
+    decord = None
+
+
+def _cuda_device_count() -> int:
+    """Number of CUDA devices OpenCV can use (0 when it was built without CUDA)"""
+    try:
+        return cv2.cuda.getCudaEnabledDeviceCount()
+    except (AttributeError, cv2.error):
+        return 0
+
+
+# Run Farneback on the GPU when OpenCV is built with CUDA (OPTICAL_FLOW_CUDA=0 forces the CPU)
+USE_CUDA_FLOW = os.environ.get('OPTICAL_FLOW_CUDA', '1') != '0' and _cuda_device_count() > 0
+_cuda_farneback = None
+# Taller frames are downscaled to this height for Farneback; the flow is resized back after
+FLOW_MAX_HEIGHT = 480
+
+
+def _farneback_cuda(gray1: np.ndarray, gray2: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Farneback flow plus its polar form computed on the GPU, with the same parameters as
+    the CPU path. Everything is queued on one stream, which is waited on before the
+    results are downloaded.
+    
+    Returns:
+        (flow, magnitude, angle) as host arrays
+    """
+    global _cuda_farneback
+    if _cuda_farneback is None:
+        _cuda_farneback = cv2.cuda.FarnebackOpticalFlow.create(
+            numLevels=3, pyrScale=0.5, fastPyramids=False, winSize=15,
+            numIters=3, polyN=5, polySigma=1.2, flags=0
+        )
+    stream = cv2.cuda.Stream()
+    gpu_gray1 = cv2.cuda_GpuMat()
+    gpu_gray2 = cv2.cuda_GpuMat()
+    gpu_gray1.upload(gray1, stream)
+    gpu_gray2.upload(gray2, stream)
+    gpu_flow = _cuda_farneback.calc(gpu_gray1, gpu_gray2, None, stream)
+    gpu_dx, gpu_dy = cv2.cuda.split(gpu_flow, stream=stream)
+    gpu_magnitude, gpu_angle = cv2.cuda.cartToPolar(gpu_dx, gpu_dy, stream=stream)
+    stream.waitForCompletion()
+    return gpu_flow.download(), gpu_magnitude.download(), gpu_angle.download()
+
+
+# 'farneback' (OpenCV, default) or 'raft' (torchvision RAFT-small, batched on the GPU if any)
+OPTICAL_FLOW_BACKEND = os.environ.get('OPTICAL_FLOW_BACKEND', 'farneback').lower()
+# Frame pairs per RAFT forward pass, and the square size frames are resized to for RAFT
+# (a multiple of 8); flow is upsampled back to the native resolution afterwards
+RAFT_BATCH_SIZE = 8
+RAFT_INPUT_SIZE = 512
+_raft = None
+
+
+def _load_raft():
+    """RAFT-small on the best available device, compiled on CUDA and warmed up; (model, device)"""
+    global _raft
+    if _raft is None:
+        from torchvision.models.optical_flow import raft_small, Raft_Small_Weights
+        if torch.cuda.is_available():
+            device = torch.device('cuda')
+        elif torch.backends.mps.is_available():
+            device = torch.device('mps')
+        else:
+            device = torch.device('cpu')
+        model = raft_small(weights=Raft_Small_Weights.DEFAULT, progress=False).eval().to(device)
+        if device.type == 'cuda':
+            model = torch.compile(model, mode='reduce-overhead')
+        # First passes compile/autotune (and capture CUDA graphs) for the fixed batch shape
+        example = torch.zeros(RAFT_BATCH_SIZE, 3, RAFT_INPUT_SIZE, RAFT_INPUT_SIZE, device=device)
+        with torch.inference_mode(), torch.autocast(device.type, dtype=torch.float16,
+                                                     enabled=device.type == 'cuda'):
+            for _ in range(3):
+                model(example, example)
+        _raft = (model, device)
+    return _raft
+
+
+def _sobel_kernels(device):
+    """3x3 Sobel x / y kernels shaped for F.conv2d (same as cv2.Sobel ksize=3)"""
+    kx = torch.tensor([[-1., 0., 1.], [-2., 0., 2.], [-1., 0., 1.]], device=device)
+    return kx.view(1, 1, 3, 3), kx.t().contiguous().view(1, 1, 3, 3)
+
+
+def compute_optical_flow_raft(frame_pairs: List[Tuple[np.ndarray, np.ndarray]]) -> List[Tuple[np.ndarray, Dict]]:
+    """
+    Dense optical flow for a batch of consecutive-frame pairs with RAFT-small
+    
+    Frames are resized to RAFT_INPUT_SIZE, run through the network in one forward pass,
+    and the flow is upsampled (and rescaled) back to the native resolution. The same
+    statistics as compute_optical_flow, plus the calculate_flow_smoothness score, are
+    computed on the device, so only the final numbers and flow fields are copied back.
+    
+    Args:
+        frame_pairs: List of (frame1, frame2) BGR frames, all the same size
+        
+    Returns:
+        List of (flow_field, flow_statistics) with 'smoothness' already included
+    """
+    model, device = _load_raft()
+    count = len(frame_pairs)
+    # Pad to the compiled batch size by repeating the last pair
+    frame_pairs = list(frame_pairs) + [frame_pairs[-1]] * (RAFT_BATCH_SIZE - count)
+    h, w = frame_pairs[0][0].shape[:2]
+    
+    def to_input(frames):
+        # BGR uint8 (B, H, W, 3) -> RGB float in [-1, 1] at the RAFT resolution
+        batch = torch.from_numpy(np.stack(frames)).to(device, non_blocking=True)
+        batch = batch.flip(-1).permute(0, 3, 1, 2).float().div_(127.5).sub_(1.0)
+        return F.interpolate(batch, size=(RAFT_INPUT_SIZE, RAFT_INPUT_SIZE), mode='bilinear', align_corners=False)
+    
+    with torch.inference_mode():
+        img1 = to_input([f1 for f1, _ in frame_pairs])
+        img2 = to_input([f2 for _, f2 in frame_pairs])
+        with torch.autocast(device.type, dtype=torch.float16, enabled=device.type == 'cuda'):
+            flow = model(img1, img2)[-1][:count]
+        flow = F.interpolate(flow.float(), size=(h, w), mode='bilinear', align_corners=False)
+        flow[:, 0] *= w / RAFT_INPUT_SIZE
+        flow[:, 1] *= h / RAFT_INPUT_SIZE
+        dx, dy = flow[:, 0], flow[:, 1]
+        
+        magnitude = torch.hypot(dx, dy).flatten(1)
+        angle = torch.remainder(torch.atan2(dy, dx), 2 * np.pi).flatten(1)
+        
+        # Smoothness: Sobel of the flow (reflect-101 border, as cv2.Sobel)
+        kx, ky = _sobel_kernels(device)
+        grad_x = F.conv2d(F.pad(flow[:, 0:1], (1, 1, 1, 1), mode='reflect'), kx)
+        grad_y = F.conv2d(F.pad(flow[:, 1:2], (1, 1, 1, 1), mode='reflect'), ky)
+        gradient_mag = torch.hypot(grad_x, grad_y).flatten(1)
+        max_grad = torch.quantile(gradient_mag, 0.95, dim=1)
+        smoothness = torch.where(max_grad > 0,
+                                 1.0 - torch.clamp(gradient_mag.mean(dim=1) / max_grad, 0, 1),
+                                 torch.ones_like(max_grad))
+        
+        columns = torch.stack([
+            magnitude.mean(dim=1),
+            magnitude.std(dim=1, unbiased=False),
+            magnitude.amax(dim=1),
+            torch.quantile(magnitude, 0.5, dim=1),
+            angle.mean(dim=1),
+            (magnitude > 0.5).float().mean(dim=1),
+            smoothness
+        ], dim=1).cpu().numpy()
+        flows = flow.permute(0, 2, 3, 1).cpu().numpy()
+    
+    results = []
+    for flow_field, values in zip(flows, columns):
+        stats = {
+            'mean_magnitude': float(values[0]),
+            'std_magnitude': float(values[1]),
+            'max_magnitude': float(values[2]),
+            'median_magnitude': float(values[3]),
+            'mean_angle': float(values[4]),
+            'flow_density': float(values[5]),
+            'smoothness': float(values[6])
+        }
+        results.append((flow_field, stats))
+    return results
+
+
+# Decode with decord when installed (OPTICAL_FLOW_DECORD=0 forces cv2.VideoCapture), and the
+# number of frame pairs fetched per get_batch call
+USE_DECORD = decord is not None and os.environ.get('OPTICAL_FLOW_DECORD', '1') != '0'
+DECORD_BATCH_PAIRS = 16
+
+
+def _open_decord(video_path: str):
+    """decord VideoReader on the GPU (NVDEC) when one is available, else the CPU; None if neither opens"""
+    if _cuda_device_count() > 0 or (torch is not None and torch.cuda.is_available()):
+        try:
+            return decord.VideoReader(video_path, ctx=decord.gpu(0))
+        except Exception as e:  # decord built without CUDA, or a codec NVDEC can't decode
+            print(f"[WARN] decord GPU decoding unavailable, using CPU: {e}")
+    try:
+        return decord.VideoReader(video_path, ctx=decord.cpu(0))
+    except Exception as e:
+        print(f"[WARN] decord could not open video, using OpenCV: {e}")
+        return None
+
+
+def _read_pairs_decord(vr, frame_indices: List[int]):
+    """
+    Yield (frame_index, frame1, frame2) like _read_pairs, decoding the frames of
+    DECORD_BATCH_PAIRS pairs per get_batch call. Frames come back as BGR host arrays so
+    the Farneback and RAFT paths take them unchanged.
+    """
+    pending = sorted(idx for idx in frame_indices if idx + 1 < len(vr))
+    for start in range(0, len(pending), DECORD_BATCH_PAIRS):
+        chunk = pending[start:start + DECORD_BATCH_PAIRS]
+        positions = sorted(set(chunk) | {idx + 1 for idx in chunk})
+        # RGB -> BGR in one copy for the whole batch
+        batch = np.ascontiguousarray(vr.get_batch(positions).asnumpy()[..., ::-1])
+        frames = dict(zip(positions, batch))
+        for idx in chunk:
+            yield idx, frames[idx], frames[idx + 1]
+
+
+def _read_pairs(cap, frame_indices: List[int]):
+    """
+    Yield (frame_index, frame1, frame2) for each sampled pair of consecutive frames
+    
+    The video is decoded front to back once instead of seeking to every pair (each seek
+    re-decodes from the previous keyframe); frames outside the pairs are only grabbed,
+    never converted.
+    """
+    if not frame_indices:
+        return
+    pending = sorted(frame_indices)
+    needed = set(pending) | {idx + 1 for idx in pending}
+    k = 0
+    prev = None
+    if pending[0] > 0:
+        # One seek to the first pair (pool workers start mid-video)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, pending[0])
+    for pos in range(pending[0], pending[-1] + 2):
+        if not cap.grab():
+            return
+        frame = None
+        if pos in needed:
+            ret, frame = cap.retrieve()
+            if not ret:
+                frame = None
+        while k < len(pending) and pending[k] + 1 == pos:
+            if prev is not None and frame is not None:
+                yield pending[k], prev, frame
+            k += 1
+        prev = frame
+
+
+def _iter_flows(pairs, use_raft: bool):
+    """Yield (frame_index, frame1, flow, stats) for each pair, with stats['smoothness'] set"""
+    if not use_raft:
+        for idx, frame1, frame2 in pairs:
+            # Compute optical flow
+            flow, stats = compute_optical_flow(frame1, frame2)
+            
+            # Calculate flow smoothness
+            stats['smoothness'] = calculate_flow_smoothness(flow)
+            yield idx, frame1, flow, stats
+        return
+    
+    batch = []
+    for pair in pairs:
+        batch.append(pair)
+        if len(batch) == RAFT_BATCH_SIZE:
+            yield from _flush_raft(batch)
+            batch = []
+    if batch:
+        yield from _flush_raft(batch)
+
+
+def _flush_raft(batch):
+    results = compute_optical_flow_raft([(frame1, frame2) for _, frame1, frame2 in batch])
+    for (idx, frame1, _), (flow, stats) in zip(batch, results):
+        yield idx, frame1, flow, stats
+
+
+# Worker processes for CPU Farneback. Opt-in through OPTICAL_FLOW_WORKERS: spawned workers
+# re-import the caller's __main__ (for the Kafka worker that loads torch, the API and a Redis
+# client per worker), so by default pairs run in-process. The command line interface uses
+# half the cores, at most MAX_DEFAULT_FLOW_WORKERS, when the variable is unset.
+FLOW_WORKERS = int(os.environ.get('OPTICAL_FLOW_WORKERS', '1'))
+MAX_DEFAULT_FLOW_WORKERS = 8
+_flow_pool = None
+
+
+def _shutdown_flow_pool():
+    """Stop the worker processes (registered with atexit when the pool is created)"""
+    global _flow_pool
+    if _flow_pool is not None:
+        _flow_pool.shutdown(wait=True, cancel_futures=True)
+        _flow_pool = None
+
+
+def _init_flow_worker():
+    # The pool already uses the cores; keep OpenCV and Numba from threading on top of it
+    cv2.setNumThreads(1)
+    if njit is not None:
+        set_num_threads(1)
+
+
+def _process_pairs(video_path: str, frame_indices: List[int], vis_indices: set) -> List[Tuple]:
+    """
+    Pool worker: _iter_flows results for a contiguous run of pairs, read with its own
+    VideoCapture. Frames and flow fields are only sent back for pairs in vis_indices.
+    """
+    cap = cv2.VideoCapture(video_path)
+    results = []
+    for idx, frame1, flow, stats in _iter_flows(_read_pairs(cap, frame_indices), False):
+        if idx in vis_indices:
+            results.append((idx, frame1, flow, stats))
+        else:
+            results.append((idx, None, None, stats))
+    cap.release()
+    return results
+
+
+def _iter_flows_parallel(video_path: str, frame_indices: List[int], vis_indices: set):
+    """Yield what _iter_flows does, with runs of pairs computed across the worker pool (in order)"""
+    global _flow_pool
+    if _flow_pool is None:
+        # spawn, not fork: a forked child inherits the parent's TBB/OpenMP (Numba) and CUDA
+        # state, which deadlocks once those thread pools have been started
+        _flow_pool = ProcessPoolExecutor(max_workers=FLOW_WORKERS, initializer=_init_flow_worker,
+                                         mp_context=multiprocessing.get_context('spawn'))
+        atexit.register(_shutdown_flow_pool)
+    # Two runs per worker so a slow run doesn't leave the others idle at the end
+    run = -(-len(frame_indices) // (FLOW_WORKERS * 2))
+    futures = []
+    for start in range(0, len(frame_indices), run):
+        indices = frame_indices[start:start + run]
+        futures.append(_flow_pool.submit(_process_pairs, video_path, indices, vis_indices.intersection(indices)))
+    for future in futures:
+        yield from future.result()
+
 
 def compute_optical_flow(frame1: np.ndarray, frame2: np.ndarray) -> Tuple[np.ndarray, Dict]:
     """
     Compute dense optical flow between two consecutive frames using Farneback algorithm
+    (on the GPU when OpenCV has CUDA support, see USE_CUDA_FLOW)
+    
+    Frames taller than FLOW_MAX_HEIGHT are downscaled before Farneback, and the flow is
+    resized back to the native resolution with the vectors rescaled to native pixels.
     
     Farneback algorithm:
     - Polynomial expansion-based approach
@@ -98,21 +437,62 @@ def compute_optical_flow(frame1: np.ndarray, frame2: np.ndarray) -> Tuple[np.nda
     gray1 = cv2.cvtColor(frame1, cv2.COLOR_BGR2GRAY)
     gray2 = cv2.cvtColor(frame2, cv2.COLOR_BGR2GRAY)
     
-    # Compute optical flow using Farneback algorithm
-    flow = cv2.calcOpticalFlowFarneback(
-        gray1, gray2,
-        None,
-        pyr_scale=0.5,      # Image pyramid scale
-        levels=3,           # Number of pyramid layers
-        winsize=15,         # Averaging window size
-        iterations=3,       # Number of iterations at each pyramid level
-        poly_n=5,           # Size of pixel neighborhood for polynomial expansion
-        poly_sigma=1.2,     # Standard deviation of Gaussian for polynomial expansion
-        flags=0
-    )
-    
-    # Calculate flow magnitude and angle
-    magnitude, angle = cv2.cartToPolar(flow[..., 0], flow[..., 1])
+    h, w = gray1.shape
+    if h > FLOW_MAX_HEIGHT:
+        size = (max(1, round(w * FLOW_MAX_HEIGHT / h)), FLOW_MAX_HEIGHT)
+        gray1 = cv2.resize(gray1, size, interpolation=cv2.INTER_AREA)
+        gray2 = cv2.resize(gray2, size, interpolation=cv2.INTER_AREA)
+    
+    magnitude = None
+    global USE_CUDA_FLOW
+    if USE_CUDA_FLOW:
+        try:
+            flow, magnitude, angle = _farneback_cuda(gray1, gray2)
+        except cv2.error as e:
+            print(f"[WARN] CUDA optical flow failed, using CPU: {e}")
+            USE_CUDA_FLOW = False
+    
+    if not USE_CUDA_FLOW:
+        # Compute optical flow using Farneback algorithm
+        flow = cv2.calcOpticalFlowFarneback(
+            gray1, gray2,
+            None,
+            pyr_scale=0.5,      # Image pyramid scale
+            levels=3,           # Number of pyramid layers
+            winsize=15,         # Averaging window size
+            iterations=3,       # Number of iterations at each pyramid level
+            poly_n=5,           # Size of pixel neighborhood for polynomial expansion
+            poly_sigma=1.2,     # Standard deviation of Gaussian for polynomial expansion
+            flags=0
+        )
+    
+    if flow.shape[0] != h:
+        # Back to the native resolution, in native pixels per frame
+        small_h, small_w = flow.shape[:2]
+        flow = cv2.resize(flow, (w, h), interpolation=cv2.INTER_LINEAR)
+        flow[..., 0] *= w / small_w
+        flow[..., 1] *= h / small_h
+        magnitude = None
+    
+    if magnitude is None and njit is not None:
+        # Magnitude, angle and the sums behind every statistic in one Numba pass
+        magnitude, partial = _flow_polar_sums(np.ascontiguousarray(flow, dtype=np.float32))
+        sums = partial.sum(axis=0)
+        count = magnitude.size
+        mean = sums[0] / count
+        stats = {
+            'mean_magnitude': float(mean),
+            'std_magnitude': float(np.sqrt(max(sums[1] / count - mean * mean, 0.0))),
+            'max_magnitude': float(partial[:, 2].max()),
+            'median_magnitude': float(np.median(magnitude)),
+            'mean_angle': float(sums[3] / count),
+            'flow_density': float(sums[4] / count)  # Percentage of moving pixels
+        }
+        return flow, stats
+    
+    if magnitude is None:
+        # Calculate flow magnitude and angle
+        magnitude, angle = cv2.cartToPolar(flow[..., 0], flow[..., 1])
     
     # Calculate statistics
     stats = {
@@ -127,6 +507,74 @@ def compute_optical_flow(frame1: np.ndarray, frame2: np.ndarray) -> Tuple[np.nda
     return flow, stats
 
 
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _flow_polar_sums(flow):
+        """
+        Per-pixel flow magnitude (float32, as cv2.cartToPolar) plus, for every row, the sum
+        of magnitudes, sum of squared magnitudes, max magnitude, sum of angles in [0, 2*pi)
+        and count of pixels moving more than 0.5 px, all from one parallel pass (no
+        magnitude/angle images from cv2.cartToPolar, and no separate reductions)
+        """
+        h, w = flow.shape[0], flow.shape[1]
+        magnitude = np.empty((h, w), dtype=np.float32)
+        partial = np.zeros((h, 5))
+        for y in prange(h):
+            total = 0.0
+            total_sq = 0.0
+            peak = 0.0
+            angle_total = 0.0
+            moving = 0
+            for x in range(w):
+                dx = flow[y, x, 0]
+                dy = flow[y, x, 1]
+                m = np.sqrt(dx * dx + dy * dy)
+                magnitude[y, x] = m
+                total += m
+                total_sq += m * m
+                peak = max(peak, m)
+                # Polynomial atan2 in [0, 2*pi), the approximation cv2.cartToPolar uses;
+                # branch-free float32 so the loop vectorizes
+                ax = abs(dx)
+                ay = abs(dy)
+                c = min(ax, ay) / (max(ax, ay) + np.float32(1e-10))
+                c2 = c * c
+                angle = (((np.float32(-0.04432655554792128) * c2 + np.float32(0.1555786518463281)) * c2
+                          - np.float32(0.3258083974640975)) * c2 + np.float32(0.9997878412794807)) * c
+                angle = np.float32(np.pi / 2) - angle if ay > ax else angle
+                angle = np.float32(np.pi) - angle if dx < 0 else angle
+                angle = np.float32(2 * np.pi) - angle if dy < 0 else angle
+                angle_total += angle
+                moving += m > 0.5
+            partial[y, 0] = total
+            partial[y, 1] = total_sq
+            partial[y, 2] = peak
+            partial[y, 3] = angle_total
+            partial[y, 4] = moving
+        return magnitude, partial
+    
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _sobel_gradient_magnitude(flow):
+        """
+        sqrt(Sobel_x(flow_x)^2 + Sobel_y(flow_y)^2) for every pixel in one parallel pass over
+        the float32 flow, with the same 3x3 kernels and reflect-101 border as cv2.Sobel
+        """
+        h, w = flow.shape[0], flow.shape[1]
+        out = np.empty((h, w), dtype=np.float32)
+        for y in prange(h):
+            ym = y - 1 if y > 0 else min(1, h - 1)
+            yp = y + 1 if y < h - 1 else max(h - 2, 0)
+            for x in range(w):
+                xm = x - 1 if x > 0 else min(1, w - 1)
+                xp = x + 1 if x < w - 1 else max(w - 2, 0)
+                gx = ((flow[ym, xp, 0] + 2.0 * flow[y, xp, 0] + flow[yp, xp, 0])
+                      - (flow[ym, xm, 0] + 2.0 * flow[y, xm, 0] + flow[yp, xm, 0]))
+                gy = ((flow[yp, xm, 1] + 2.0 * flow[yp, x, 1] + flow[yp, xp, 1])
+                      - (flow[ym, xm, 1] + 2.0 * flow[ym, x, 1] + flow[ym, xp, 1]))
+                out[y, x] = np.sqrt(gx * gx + gy * gy)
+        return out
+
+
 def calculate_flow_smoothness(flow: np.ndarray) -> float:
     """
     Calculate smoothness of optical flow field
@@ -144,17 +592,21 @@ def calculate_flow_smoothness(flow: np.ndarray) -> float:
     Returns:
         Smoothness score (0-1, higher = smoother = more realistic)
     """
-    # Calculate spatial gradients of flow
-    dx = cv2.Sobel(flow[..., 0], cv2.CV_64F, 1, 0, ksize=3)
-    dy = cv2.Sobel(flow[..., 1], cv2.CV_64F, 0, 1, ksize=3)
-    
-    # Calculate gradient magnitude (measures flow consistency)
-    gradient_mag = np.sqrt(dx**2 + dy**2)
+    if njit is not None:
+        # Sobel + gradient magnitude fused into one Numba kernel
+        gradient_mag = _sobel_gradient_magnitude(np.ascontiguousarray(flow, dtype=np.float32))
+    else:
+        # Calculate spatial gradients of flow (float32, like the flow itself)
+        dx = cv2.Sobel(flow[..., 0], cv2.CV_32F, 1, 0, ksize=3)
+        dy = cv2.Sobel(flow[..., 1], cv2.CV_32F, 0, 1, ksize=3)
+        
+        # Calculate gradient magnitude (measures flow consistency), written over dx
+        gradient_mag = cv2.magnitude(dx, dy, dx)
     
     # Normalize to [0, 1] (lower gradient = smoother)
     max_grad = np.percentile(gradient_mag, 95)  # Use 95th percentile to avoid outliers
     if max_grad > 0:
-        smoothness = 1.0 - np.clip(np.mean(gradient_mag) / max_grad, 0, 1)
+        smoothness = 1.0 - np.clip(np.mean(gradient_mag, dtype=np.float64) / max_grad, 0, 1)
     else:
         smoothness = 1.0
     
@@ -180,33 +632,22 @@ def detect_flow_anomalies(flow_stats: List[Dict], sensitivity: float = 2.5) -> L
     if len(flow_stats) < 10:
         return []
     
-    # Extract magnitude values
-    magnitudes = np.array([s['mean_magnitude'] for s in flow_stats])
-    smoothness_values = np.array([s.get('smoothness', 0) for s in flow_stats])
-    
-    # Detect magnitude anomalies (sudden motion spikes)
-    mag_mean = np.mean(magnitudes)
-    mag_std = np.std(magnitudes)
-    mag_threshold_high = mag_mean + sensitivity * mag_std
-    mag_threshold_low = mag_mean - sensitivity * mag_std
-    
-    mag_anomalies = np.where((magnitudes > mag_threshold_high) | 
-                             (magnitudes < mag_threshold_low))[0].tolist()
-    
-    # Detect smoothness anomalies (rough motion)
-    if len(smoothness_values) > 0 and smoothness_values.max() > 0:
-        smooth_mean = np.mean(smoothness_values)
-        smooth_std = np.std(smoothness_values)
-        smooth_threshold = smooth_mean - sensitivity * smooth_std
-        smooth_anomalies = np.where(smoothness_values < smooth_threshold)[0].tolist()
-    else:
-        smooth_anomalies = []
+    count = len(flow_stats)
+    magnitudes = np.fromiter((s['mean_magnitude'] for s in flow_stats), dtype=np.float64, count=count)
+    smoothness_values = np.fromiter((s.get('smoothness', 0) for s in flow_stats), dtype=np.float64, count=count)
+    
+    # Magnitude anomalies (sudden motion spikes or drops): outside mean +/- sensitivity * std
+    anomaly_mask = np.abs(magnitudes - magnitudes.mean()) > sensitivity * magnitudes.std()
     
-    # Combine anomalies
-    all_anomalies = list(set(mag_anomalies + smooth_anomalies))
-    all_anomalies.sort()
+    # Smoothness anomalies (rough motion)
+    if smoothness_values.max() > 0:
+        anomaly_mask |= smoothness_values < smoothness_values.mean() - sensitivity * smoothness_values.std()
     
-    return all_anomalies
+    return np.flatnonzero(anomaly_mask).tolist()
+
+
+# Scratch images for visualize_optical_flow, keyed by (height, width)
+_vis_scratch = {}
 
 
 def visualize_optical_flow(frame: np.ndarray, flow: np.ndarray) -> np.ndarray:
@@ -230,14 +671,20 @@ def visualize_optical_flow(frame: np.ndarray, flow: np.ndarray) -> np.ndarray:
     # Calculate magnitude and angle
     magnitude, angle = cv2.cartToPolar(flow[..., 0], flow[..., 1])
     
-    # Create HSV image
-    hsv = np.zeros((h, w, 3), dtype=np.uint8)
+    # HSV and BGR scratch images are reused across calls for the same frame size
+    scratch = _vis_scratch.get((h, w))
+    if scratch is None:
+        hsv = np.empty((h, w, 3), dtype=np.uint8)
+        hsv[..., 2] = 255  # Value: maximum brightness
+        scratch = _vis_scratch[(h, w)] = (hsv, np.empty((h, w, 3), dtype=np.uint8))
+    hsv, flow_vis = scratch
+    
+    # Fill HSV image
     hsv[..., 0] = angle * 180 / np.pi / 2  # Hue: direction
     hsv[..., 1] = cv2.normalize(magnitude, None, 0, 255, cv2.NORM_MINMAX)  # Saturation: magnitude
-    hsv[..., 2] = 255  # Value: maximum brightness
     
     # Convert to BGR for display
-    flow_vis = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+    cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR, dst=flow_vis)
     
     # Blend with original frame for context
     blended = cv2.addWeighted(frame, 0.5, flow_vis, 0.5, 0)
@@ -305,6 +752,27 @@ def generate_flow_plot(flow_stats: List[Dict],
     plt.close()
 
 
+# JPEG quality for the per-pair flow_frames visualizations
+FLOW_FRAME_JPEG_QUALITY = 85
+
+
+def _start_image_writer(maxsize: int = 32) -> Tuple[queue.Queue, threading.Thread]:
+    """
+    Background thread that cv2.imwrite()s (path, image, params) items from the returned
+    queue until it receives None, so encoding overlaps the flow computation
+    """
+    write_q = queue.Queue(maxsize=maxsize)
+    
+    def _writer():
+        while (item := write_q.get()) is not None:
+            path, image, params = item
+            cv2.imwrite(path, image, params)
+    
+    writer = threading.Thread(target=_writer, name='flow-frame-writer', daemon=True)
+    writer.start()
+    return write_q, writer
+
+
 def analyze_optical_flow(video_path: str,
                          output_dir: str,
                          sample_frames: int = 50,
@@ -331,9 +799,14 @@ def analyze_optical_flow(video_path: str,
     flow_frames_dir.mkdir(exist_ok=True)
     
     # Open video
-    cap = cv2.VideoCapture(video_path)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
+    vr = _open_decord(video_path) if USE_DECORD else None
+    if vr is not None:
+        total_frames = len(vr)
+        fps = vr.get_avg_fps()
+    else:
+        cap = cv2.VideoCapture(video_path)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS)
     
     # Calculate frame indices to analyze
     if total_frames < sample_frames:
@@ -344,33 +817,37 @@ def analyze_optical_flow(video_path: str,
     print(f"[INFO] Video: {total_frames} frames @ {fps:.2f} FPS")
     print(f"[INFO] Analyzing {len(frame_indices)} frame pairs...")
     
+    use_raft = OPTICAL_FLOW_BACKEND == 'raft'
+    if use_raft and torch is None:
+        print("[WARN] OPTICAL_FLOW_BACKEND=raft needs PyTorch; using Farneback")
+        use_raft = False
+    
     flow_stats = []
-    prev_frame = None
     processed = 0
     
-    for idx in frame_indices:
-        cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
-        ret1, frame1 = cap.read()
-        ret2, frame2 = cap.read()
-        
-        if not (ret1 and ret2):
-            continue
-        
-        # Compute optical flow
-        flow, stats = compute_optical_flow(frame1, frame2)
-        
-        # Calculate flow smoothness
-        smoothness = calculate_flow_smoothness(flow)
-        stats['smoothness'] = smoothness
+    # Save visualization for every 10th frame
+    vis_indices = set(frame_indices[9::10])
+    
+    if not use_raft and not USE_CUDA_FLOW and FLOW_WORKERS > 1 and len(frame_indices) > 1:
+        flows = _iter_flows_parallel(video_path, frame_indices, vis_indices)
+    elif vr is not None:
+        flows = _iter_flows(_read_pairs_decord(vr, frame_indices), use_raft)
+    else:
+        flows = _iter_flows(_read_pairs(cap, frame_indices), use_raft)
+    
+    write_q, writer = _start_image_writer()
+    jpeg_params = [cv2.IMWRITE_JPEG_QUALITY, FLOW_FRAME_JPEG_QUALITY]
+    
+    for idx, frame1, flow, stats in flows:
         stats['frame_index'] = idx
         
         flow_stats.append(stats)
         
-        # Save visualization for every 10th frame
-        if len(flow_stats) % 10 == 0:
+        if idx in vis_indices:
+            # visualize_optical_flow returns a new image, so it can be queued as is
             flow_vis = visualize_optical_flow(frame1, flow)
-            vis_path = flow_frames_dir / f"flow_{idx:04d}.png"
-            cv2.imwrite(str(vis_path), flow_vis)
+            vis_path = flow_frames_dir / f"flow_{idx:04d}.jpg"
+            write_q.put((str(vis_path), flow_vis, jpeg_params))
         
         processed += 1
         if processed % 5 == 0:
@@ -382,7 +859,13 @@ def analyze_optical_flow(video_path: str,
                 except Exception:
                     pass
     
-    cap.release()
+    if vr is not None:
+        del vr
+    else:
+        cap.release()
+    
+    write_q.put(None)
+    writer.join()
     
     print(f"[INFO] Detecting flow anomalies...")
     
@@ -419,7 +902,10 @@ def analyze_optical_flow(video_path: str,
     ret1, frame1 = cap.read()
     ret2, frame2 = cap.read()
     if ret1 and ret2:
-        flow, _ = compute_optical_flow(frame1, frame2)
+        if use_raft:
+            flow, _ = compute_optical_flow_raft([(frame1, frame2)])[0]
+        else:
+            flow, _ = compute_optical_flow(frame1, frame2)
         flow_vis = visualize_optical_flow(frame1, flow)
         summary_path = output_path / "flow_visualization.png"
         cv2.imwrite(str(summary_path), flow_vis)
@@ -478,6 +964,11 @@ def main():
     sample_frames = int(sys.argv[3]) if len(sys.argv) > 3 else 50
     sensitivity = float(sys.argv[4]) if len(sys.argv) > 4 else 2.5
     
+    # Standalone runs parallelize CPU Farneback by default (see FLOW_WORKERS)
+    global FLOW_WORKERS
+    if 'OPTICAL_FLOW_WORKERS' not in os.environ:
+        FLOW_WORKERS = min(MAX_DEFAULT_FLOW_WORKERS, max(1, (os.cpu_count() or 1) // 2))
+    
     # Run analysis
     results = analyze_optical_flow(
         video_path,
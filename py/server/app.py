@@ -14,7 +14,7 @@ if os.path.join(BASE_DIR, 'VidTraditional') not in sys.path:
     sys.path.append(os.path.join(BASE_DIR, 'VidTraditional'))
 
 # Reuse existing 2dCNN API endpoints by delegating to its Flask app
-from api import app as cnn_app, load_models  # type: ignore
+from api import app as cnn_app, load_models, ORJSONProvider, orjson  # type: ignore
 
 # Video traditional methods (to be wrapped via functions)
 from video_noise_pattern import analyze_noise_pattern  # type: ignore
@@ -22,6 +22,8 @@ from video_noise_pattern import analyze_noise_pattern  # type: ignore
 
 load_dotenv()
 app = Flask(__name__)
+if orjson is not None:
+    app.json = ORJSONProvider(app)
 app.config['JSONIFY_PRETTYPRINT_REGULAR'] = True
 app.logger.setLevel('INFO')
 
@@ -22,7 +22,7 @@ from optical_flow_analysis import analyze_optical_flow  # type: ignore
 from video_frequency_analysis import analyze_frequency_domain  # type: ignore
 from temporal_inconsistency import detect_temporal_inconsistency  # type: ignore
 from video_copy_move import detect_copy_move  # type: ignore
-from api_utils import download_video_from_url  # type: ignore
+from api_utils import download_video_from_url, open_image  # type: ignore
 
 # Kafka & Redis
 from kafka import KafkaConsumer, KafkaProducer
@@ -30,6 +30,28 @@ import redis
 from PIL import Image
 import io
 
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib encoder
+    orjson = None
+
+
+def _json_dumps(value):
+    """
+    Encode a Kafka message value as UTF-8 JSON bytes (orjson also handles NumPy values and,
+    like json.dumps and the API's ORJSONProvider, non-string dict keys)
+    """
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value).encode('utf-8')
+
+
+def _json_loads(data):
+    """Decode a UTF-8 JSON Kafka message value"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode('utf-8'))
+
 KAFKA_BOOTSTRAP = os.environ.get('KAFKA_BOOTSTRAP', 'localhost:9092')
 GROUP_ID = os.environ.get('KAFKA_GROUP_ID', 'py-analyzer-group')
 KAFKA_OFFSET_RESET = os.environ.get('KAFKA_OFFSET_RESET', 'latest')  # 'latest' by default to avoid replaying old messages
@@ -148,12 +170,12 @@ def process_image_ai(task: dict):
     if image_bytes_b64:
         import base64
         print(f"[DEBUG] Loading image from base64 bytes")
-        img = Image.open(io.BytesIO(base64.b64decode(image_bytes_b64))).convert('RGB')
+        img = open_image(io.BytesIO(base64.b64decode(image_bytes_b64)), transform.size)
     elif image_url:
         from api_utils import download_image_from_url
         print(f"[DEBUG] Downloading image from URL: {image_url}")
         try:
-            img = download_image_from_url(image_url)
+            img = download_image_from_url(image_url, target_size=transform.size)
             print(f"[DEBUG] Image downloaded successfully, size: {img.size}")
         except Exception as e:
             print(f"[ERROR] Failed to download image from {image_url}: {e}")
@@ -175,7 +197,8 @@ def process_image_ai(task: dict):
     
     print(f"[DEBUG] Using device: {device}")
     try:
-        result = predict_single_image(model=model, image=img, transform=transform, device=device)
+        result = predict_single_image(model=model, image=img, transform=transform, device=device,
+                                      staging=api.staging_buffers.get(model_name))
         print(f"[DEBUG] Inference completed successfully. Result: {result}")
     except Exception as e:
         print(f"[ERROR] Inference failed: {e}")
@@ -427,13 +450,13 @@ def worker_loop():
         TOPIC_IMAGE_AI, TOPIC_VIDEO_TRAD, TOPIC_VIDEO_AI,
         bootstrap_servers=KAFKA_BOOTSTRAP,
         group_id=GROUP_ID,
-        value_deserializer=lambda m: json.loads(m.decode('utf-8')),
+        value_deserializer=_json_loads,
         key_deserializer=lambda m: m.decode('utf-8') if m else None,
         enable_auto_commit=True,
         auto_offset_reset=KAFKA_OFFSET_RESET
     )
     producer = KafkaProducer(bootstrap_servers=KAFKA_BOOTSTRAP,
-                             value_serializer=lambda v: json.dumps(v).encode('utf-8'),
+                             value_serializer=_json_dumps,
                              key_serializer=lambda v: v.encode('utf-8') if v else None)
 
     for msg in consumer:
@@ -478,7 +501,6 @@ def worker_loop():
             # Publish result
             result_payload = {'success': True, 'data': result}
             print(f"[INFO] Publishing result to Kafka topic '{RESULT_TOPIC}' with key '{task_id}'")
-            print(f"[DEBUG] Result payload: {json.dumps(result_payload, indent=2)}")
             
             future = producer.send(RESULT_TOPIC, key=task_id, value=result_payload)
             # Wait for the message to be sent